@@ -0,0 +1,327 @@
+import os
+import hmac
+import json
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from event_log import EVENTS
+from hls_output import MIME_TYPES
+
+CLIP_TIMEOUT_SEC = 30
+MAX_CONCURRENT_CLIPS = 2  # 재먹싱 동시 실행 제한 (CPU 보호)
+
+_clip_slots = threading.BoundedSemaphore(MAX_CONCURRENT_CLIPS)
+
+
+def extract_clip(src_path, start_sec, end_sec, out_path):
+    """
+    세그먼트에서 [start_sec, end_sec] 구간을 재인코딩 없이 재먹싱합니다.
+    시작 지점은 직전 키프레임으로 맞춰집니다.
+    """
+    pipeline = Gst.parse_launch(
+        f'filesrc location="{src_path}" ! qtdemux ! queue ! h265parse ! '
+        f'mp4mux faststart=true ! filesink location="{out_path}"'
+    )
+    bus = pipeline.get_bus()
+    try:
+        pipeline.set_state(Gst.State.PAUSED)
+        pipeline.get_state(CLIP_TIMEOUT_SEC * Gst.SECOND)
+        pipeline.seek(
+            1.0,
+            Gst.Format.TIME,
+            Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT | Gst.SeekFlags.SNAP_BEFORE,
+            Gst.SeekType.SET,
+            int(start_sec * Gst.SECOND),
+            Gst.SeekType.SET,
+            int(end_sec * Gst.SECOND),
+        )
+        pipeline.set_state(Gst.State.PLAYING)
+        msg = bus.timed_pop_filtered(
+            CLIP_TIMEOUT_SEC * Gst.SECOND,
+            Gst.MessageType.EOS | Gst.MessageType.ERROR,
+        )
+        if msg is None:
+            EVENTS.error("clip_timeout", f"❌ 클립 추출 시간 초과: {src_path}")
+            return False
+        if msg.type == Gst.MessageType.ERROR:
+            err, _ = msg.parse_error()
+            EVENTS.error("clip_failed", f"❌ 클립 추출 실패: {src_path} - {err}")
+            return False
+        return True
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+
+class ClipRequestHandler(BaseHTTPRequestHandler):
+    server_version = "SaffirClip/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, content_type, extra_headers=None):
+        """Range 헤더(단일 구간)를 지원하는 파일 전송"""
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+            if not match or (not match.group(1) and not match.group(2)):
+                self.send_error(416)
+                return
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def _authorized(self, query):
+        token = self.server.token
+        if not token:
+            return True
+        header = self.headers.get("Authorization", "")
+        supplied = header[len("Bearer "):] if header.startswith("Bearer ") else query.get("token", [""])[0]
+        return hmac.compare_digest(supplied.encode(), token.encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if not self._authorized(query):
+            self.send_error(401)
+            return
+        try:
+            if url.path == "/segments":
+                start = float(query["from"][0]) if "from" in query else None
+                end = float(query["to"][0]) if "to" in query else None
+                self._send_json(self.server.index.list(start, end))
+            elif url.path.startswith("/segments/"):
+                self._handle_segment(os.path.basename(url.path))
+            elif url.path == "/clients" and self.server.stats_provider:
+                self._send_json(self.server.stats_provider())
+            elif url.path == "/clip":
+                self._handle_clip(float(query["start"][0]), float(query["end"][0]))
+            else:
+                self.send_error(404)
+        except (KeyError, ValueError):
+            self.send_error(400)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _handle_segment(self, filename):
+        segment = self.server.index.get(filename)
+        if not segment:
+            self.send_error(404)
+            return
+        try:
+            self._send_file(
+                segment["path"],
+                "video/mp4",
+                {"X-Segment-Start": str(segment["start"])},
+            )
+        except FileNotFoundError:
+            # 업로드 후 막 삭제된 세그먼트
+            self.send_error(404)
+
+    def _handle_clip(self, start, end):
+        """
+        [start, end) (epoch 초) 구간 클립을 반환합니다.
+        요청 구간이 여러 세그먼트에 걸치면 첫 세그먼트 끝에서 잘리며,
+        실제 구간은 X-Clip-Start / X-Clip-End 헤더로 알려줍니다.
+        """
+        if end <= start:
+            self.send_error(400)
+            return
+        segments = self.server.index.list(start, end)
+        if not segments:
+            self.send_error(404)
+            return
+
+        segment = segments[0]
+        offset_start = max(start - segment["start"], 0)
+        offset_end = min(end - segment["start"], segment["duration"])
+
+        # 키프레임 기준으로 실제 시작 지점 계산
+        key_start = 0
+        for t, _ in segment["keyframes"]:
+            if t > offset_start:
+                break
+            key_start = t
+
+        if not _clip_slots.acquire(timeout=CLIP_TIMEOUT_SEC):
+            self.send_error(503)
+            return
+        fd, out_path = tempfile.mkstemp(suffix=".mp4", dir=self.server.tmp_dir)
+        os.close(fd)
+        try:
+            if not extract_clip(segment["path"], offset_start, offset_end, out_path):
+                self.send_error(500)
+                return
+            self._send_file(
+                out_path,
+                "video/mp4",
+                {
+                    "X-Clip-Start": str(segment["start"] + key_start),
+                    "X-Clip-End": str(segment["start"] + offset_end),
+                },
+            )
+        finally:
+            _clip_slots.release()
+            if os.path.exists(out_path):
+                os.remove(out_path)
+
+
+class ClipServer:
+    """
+    로컬 세그먼트 조회용 HTTP 서버
+      GET /segments?from=&to=        세그먼트 목록 (키프레임 오프셋 포함)
+      GET /segments/<파일명>          세그먼트 원본 (Range 지원)
+      GET /clip?start=&end=          구간 클립 (재인코딩 없는 재먹싱)
+      GET /clients                   RTSP 클라이언트별 전송 방식/비트레이트
+
+    기본은 루프백에만 바인딩하며, token 이 있으면 모든 요청에
+    Authorization: Bearer <token> 헤더 또는 ?token= 파라미터가 필요합니다.
+    """
+
+    def __init__(self, index, port=8555, tmp_dir=None, stats_provider=None, host="127.0.0.1", token=None):
+        self.httpd = ThreadingHTTPServer((host, port), ClipRequestHandler)
+        self.httpd.token = token
+        self.httpd.daemon_threads = True
+        self.httpd.index = index
+        self.httpd.tmp_dir = tmp_dir or tempfile.gettempdir()
+        self.httpd.stats_provider = stats_provider
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        print(f"✅ 클립 서버 시작 ({host}:{port}{', 토큰 인증' if self.httpd.token else ''})")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "Range",
+    "Access-Control-Expose-Headers": "Content-Length, Content-Range",
+}
+
+
+class LiveRequestHandler(ClipRequestHandler):
+    """
+    HLS 플레이리스트/세그먼트만 제공 (녹화 세그먼트와 /clip 은 노출하지 않음)
+    토큰은 경로에 포함(/live/<token>/master.m3u8)되므로 플레이리스트의 상대 경로에도
+    그대로 유지되고, Authorization 헤더가 없어 브라우저 CORS preflight 도 필요 없습니다.
+    """
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        for key, value in CORS_HEADERS.items():
+            self.send_header(key, value)
+        self.send_header("Access-Control-Max-Age", "600")
+        self.end_headers()
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if not path.startswith("/live/"):
+            self.send_error(404)
+            return
+        relative_path = path[len("/live/"):]
+        token = self.server.token
+        if token:
+            supplied, _, relative_path = relative_path.partition("/")
+            if not hmac.compare_digest(supplied.encode(), token.encode()):
+                self.send_error(401)
+                return
+        try:
+            self._handle_live(relative_path)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _handle_live(self, relative_path):
+        live_dir = os.path.realpath(self.server.live_dir)
+        path = os.path.realpath(os.path.join(live_dir, relative_path))
+        content_type = MIME_TYPES.get(os.path.splitext(path)[1])
+        if not path.startswith(live_dir + os.sep) or not content_type or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        # 플레이리스트는 계속 갱신되므로 캐시 금지, 세그먼트는 불변이므로 짧게 캐시
+        cache = "no-cache" if path.endswith(".m3u8") else "max-age=60"
+        try:
+            self._send_file(path, content_type, dict(CORS_HEADERS, **{"Cache-Control": cache}))
+        except FileNotFoundError:
+            # 링에서 막 삭제된 세그먼트
+            self.send_error(404)
+
+
+class LiveServer:
+    """
+    브라우저용 HLS (fMP4) 라이브 HTTP 서버
+      GET /live/master.m3u8            (token 없음)
+      GET /live/<token>/master.m3u8    (token 지정 시)
+    클립 서버와 주소/포트/인증을 분리해, 라이브만 LAN 에 공개할 수 있습니다.
+    """
+
+    def __init__(self, live_dir, port=8556, host="0.0.0.0", token=None):
+        self.httpd = ThreadingHTTPServer((host, port), LiveRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.live_dir = live_dir
+        self.httpd.token = token
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        print(f"✅ HLS 라이브 서버 시작 ({host}:{port}{', 토큰 경로' if self.httpd.token else ''})")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+import socketserver
+
+from gi.repository import GLib
+
+from event_log import EVENTS
+
+CONTROL_TIMEOUT_SEC = 5  # 메인 루프에서 요청 처리를 기다리는 최대 시간
+
+
+def parse_options(value):
+    """'bps=51200000 rc-mode=vbr' 형식의 엘리먼트 옵션을 dict 로 변환"""
+    options = {}
+    for item in value.split():
+        name, sep, option_value = item.partition("=")
+        if not sep:
+            raise ValueError(f"잘못된 옵션: {item}")
+        options[name] = option_value
+    return options
+
+
+def format_options(options):
+    return " ".join(f"{name}={value}" for name, value in options.items())
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    """한 줄에 JSON 요청 하나, 같은 연결로 JSON 응답 한 줄"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("요청은 JSON 객체여야 합니다")
+                response = self.server.dispatch(request)
+            except ValueError as e:
+                response = {"ok": False, "error": str(e)}
+            try:
+                self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+
+class _ControlUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ControlServer:
+    """
+    로컬 설정 변경 API (Unix 소켓)
+      {}                                  현재 설정 조회
+      {"encoder_options": "bps=20000000"} 변경할 항목만 전달
+
+    handler(request) 는 GLib 메인 루프에서 호출되므로 파이프라인을 직접 변경해도 안전합니다.
+    """
+
+    def __init__(self, socket_path, handler):
+        self.socket_path = socket_path
+        self.handler = handler
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.server = _ControlUnixServer(socket_path, ControlRequestHandler)
+        self.server.dispatch = self._dispatch
+        os.chmod(socket_path, 0o660)
+        self.thread = None
+
+    def _dispatch(self, request):
+        result = {}
+        done = threading.Event()
+
+        def run():
+            try:
+                result.update(self.handler(request))
+            except Exception as e:
+                EVENTS.error("control_request_failed", f"❌ 설정 변경 처리 오류: {e}", request=request)
+                result.update(ok=False, error=str(e))
+            done.set()
+            return False
+
+        GLib.idle_add(run)
+        if not done.wait(CONTROL_TIMEOUT_SEC):
+            return {"ok": False, "error": "메인 루프 응답 없음"}
+        return result
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"🎛️ 설정 변경 API 시작: {self.socket_path}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
@@ -0,0 +1,176 @@
+import sys
+import queue
+import signal
+import logging
+import threading
+import time
+
+import rtsp_server
+import s3_upload
+from event_log import EVENTS, LEVELS
+from net_monitor import NetworkMonitor
+from rtsp_server import (
+    RtspRecordingService,
+    get_local_ip,
+    register_or_update_device,
+    reregister_device,
+)
+
+# rtsp_server 가 로깅을 끄므로 업로더 로그는 다시 활성화
+logging.disable(logging.NOTSET)
+logger = logging.getLogger("device_agent")
+
+RETRY_INTERVAL_SEC = 5  # 실패한 업로드 재시도 주기
+CLEANUP_INTERVAL_SEC = 150  # 처리 목록 정리 주기
+
+
+def run_upload_worker(upload_queue, stop_event):
+    """
+    녹화 서비스가 큐로 넘겨준 완료 파일을 업로드합니다.
+    폴더를 주기적으로 스캔하지 않고, 시작 시 한 번만 남아있는 파일을 확인합니다.
+    """
+    logger.info("🧹 기존 파일 확인 중...")
+    s3_upload.scan_frame_directory()
+    s3_upload.scan_video_directory()
+
+    last_retry = last_cleanup = time.monotonic()
+    while not stop_event.is_set():
+        try:
+            kind, path = upload_queue.get(timeout=1)
+            if kind == "video":
+                EVENTS.info("video_queued", f"📦 영상 업로드 큐에 추가: {path}", path=path)
+                s3_upload.submit_video(path)
+            else:
+                s3_upload.submit_image(path)
+        except queue.Empty:
+            pass
+        except Exception as e:
+            EVENTS.error("upload_queue_error", f"❌ 업로드 큐 처리 오류: {e}")
+        s3_upload.flush_pending_frames()
+
+        now = time.monotonic()
+        if now - last_retry >= RETRY_INTERVAL_SEC and s3_upload.network_available.is_set():
+            s3_upload.handle_failed_uploads()
+            last_retry = now
+        if now - last_cleanup >= CLEANUP_INTERVAL_SEC:
+            s3_upload.cleanup_stale_entries()
+            last_cleanup = now
+
+
+def parse_args():
+    parser = rtsp_server.build_arg_parser()
+    parser.add_argument("--api-host", default=rtsp_server.API_HOST)
+    s3_upload.add_preprocess_args(parser)
+    s3_upload.add_analytics_args(parser)
+    s3_upload.add_retention_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    EVENTS.configure(service="device_agent", level=LEVELS[args.log_level])
+    EVENTS.install_dump_signal()
+
+    # 녹화/업로드 공용 설정 및 디바이스 식별 정보
+    rtsp_server.API_HOST = args.api_host
+    s3_upload.configure(
+        record_path=args.record_path,
+        frame_path=args.frame_path,
+        api_base_url=args.api_host,
+    )
+    s3_upload.DEVICE_IDENTITY = rtsp_server.DEVICE_IDENTITY
+    s3_upload.configure_preprocess(args)
+    s3_upload.configure_analytics(args)
+    s3_upload.configure_retention(args)
+
+    ip = get_local_ip()
+    if not ip:
+        print("❌ 로컬 IP 주소 확인 실패")
+        sys.exit(1)
+    print(f"✅ 로컬 IP 주소: {ip}")
+
+    sn = register_or_update_device(ip)
+    if not sn or sn == "UNKNOWN":
+        print("❌ 유효한 SN 없음")
+        sys.exit(1)
+
+    # 링크/주소 변경 감시 (재등록 및 업로드 일시정지/재개를 한 모니터에서 처리)
+    monitor = NetworkMonitor()
+    # 업로드 재개가 디바이스 재등록 요청보다 먼저 처리되도록 순서 유지
+    monitor.add_listener(s3_upload.on_network_change)
+    monitor.add_listener(reregister_device)
+    if not monitor.start():
+        s3_upload.network_available.set()
+
+    upload_queue = queue.Queue()
+    stop_event = threading.Event()
+
+    print(f"🚀 디바이스 에이전트 시작 (SN: {sn})")
+    service = RtspRecordingService(
+        device=args.device,
+        port=args.port,
+        mount=args.mount,
+        encoder=args.encoder,
+        encoder_options=args.encoder_options,
+        payload=args.payload,
+        pt=args.pt,
+        record_path=args.record_path,
+        frame_path=args.frame_path,
+        clip_port=args.clip_port,
+        clip_host=args.clip_host,
+        clip_token=args.clip_token or None,
+        rtsp_protocols=args.rtsp_protocols,
+        multicast_range=args.multicast_range,
+        multicast_ports=args.multicast_ports,
+        multicast_ttl=args.multicast_ttl,
+        tcp_send_buffer=args.tcp_send_buffer,
+        max_clients=args.max_clients,
+        rtsp_backlog=args.rtsp_backlog,
+        hls_dir=args.hls_dir,
+        hls_target_duration=args.hls_target_duration,
+        hls_playlist_length=args.hls_playlist_length,
+        hls_h264=args.hls_h264,
+        hls_h264_encoder=args.hls_h264_encoder,
+        hls_h264_options=args.hls_h264_options,
+        hls_h264_width=args.hls_h264_width,
+        hls_h264_height=args.hls_h264_height,
+        hls_port=args.hls_port,
+        hls_host=args.hls_host,
+        hls_token=args.hls_token or None,
+        width=args.width,
+        height=args.height,
+        framerate=args.framerate,
+        frame_rate=args.frame_rate,
+        segment_seconds=args.segment_seconds,
+        control_socket=args.control_socket,
+        on_segment_ready=lambda path: upload_queue.put(("video", path)),
+        on_frame_ready=lambda path: upload_queue.put(("frame", path)),
+    )
+
+    worker = threading.Thread(
+        target=run_upload_worker, args=(upload_queue, stop_event), daemon=True
+    )
+    worker.start()
+
+    def shutdown(sig, frame):
+        print("👋 종료 신호 받음")
+        stop_event.set()
+        monitor.stop()
+        service.stop()
+        logger.info("🛑 업로드 작업 완료 대기 중...")
+        s3_upload.network_available.set()  # 연결 대기 중인 작업이 멈춰있지 않도록
+        s3_upload.flush_pending_frames(force=True)
+        s3_upload.analytics_executor.shutdown(wait=True)
+        s3_upload.preprocess_executor.shutdown(wait=True)
+        s3_upload.write_metadata_batch(force=True)
+        s3_upload.image_upload_executor.shutdown(wait=True)
+        s3_upload.video_upload_executor.shutdown(wait=True)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    service.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import threading
+
+
+class DeviceIdentity:
+    """
+    sn.txt 에서 읽은 디바이스 SN 캐시
+    파일의 mtime 이 바뀔 때만 다시 읽으므로 매 업로드/프레임마다 파일을 읽지 않습니다.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self._lock = threading.Lock()
+        self._path = None
+        self._mtime = None
+        self._sn = "UNKNOWN"
+
+    def _current_file(self):
+        for path in self.paths:
+            try:
+                return path, os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+        return None, None
+
+    @property
+    def sn(self):
+        path, mtime = self._current_file()
+        with self._lock:
+            if path != self._path or mtime != self._mtime:
+                self._path, self._mtime = path, mtime
+                self._sn = "UNKNOWN"
+                if path:
+                    try:
+                        with open(path, "r") as f:
+                            self._sn = f.read().strip() or "UNKNOWN"
+                    except Exception:
+                        pass
+            return self._sn
+
+    def save(self, sn):
+        """SN 을 첫 번째 경로에 저장합니다."""
+        try:
+            with open(self.paths[0], "w") as f:
+                f.write(sn)
+            return True
+        except Exception:
+            return False
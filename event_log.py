@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import threading
+from collections import deque
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+RING_SIZE = 2000  # 메모리에 보관할 최근 이벤트 수
+RATE_LIMIT_SEC = 10  # 같은 이벤트 키는 이 간격에 한 번만 출력 (나머지는 suppressed 로 집계)
+AGGREGATE_INTERVAL_SEC = 60  # count() 집계 출력 주기
+
+
+class EventLog:
+    """
+    두 서비스가 함께 쓰는 구조화 이벤트 로그 (JSON 한 줄씩 stderr → journald)
+
+    - event()/info()/... 는 링 버퍼에 추가하고 출력 큐에 넣기만 하므로 호출 스레드를 막지 않습니다.
+    - 같은 키의 이벤트는 RATE_LIMIT_SEC 마다 한 번만 출력하고, 생략된 수를 다음 출력에 붙입니다.
+      다음 출력이 없으면 AGGREGATE_INTERVAL_SEC 집계 때 생략 건수만 따로 출력합니다.
+      ERROR 는 하나도 빠지지 않도록 제한하지 않습니다.
+    - count() 는 출력 없이 개수만 세고 AGGREGATE_INTERVAL_SEC 마다 "최근 60초 동안 N건" 으로 요약합니다.
+    - SIGUSR1 (install_dump_signal) 또는 dump() 로 링 버퍼 전체를 파일로 덤프합니다.
+    """
+
+    def __init__(self, service="device", level=INFO, stream=None):
+        self.service = service
+        self.level = level
+        self.stream = stream or sys.stderr
+        self.ring = deque(maxlen=RING_SIZE)
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._last_emit = {}
+        self._suppressed = {}
+        self._counts = {}
+        self._writer = None
+
+    def configure(self, service=None, level=None):
+        if service:
+            self.service = service
+        if level is not None:
+            self.level = level
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, daemon=True)
+                self._writer.start()
+
+    def event(self, level, key, msg="", **fields):
+        record = {
+            "ts": round(time.time(), 3),
+            "level": LEVEL_NAMES.get(level, str(level)),
+            "service": self.service,
+            "event": key,
+            "msg": msg,
+        }
+        record.update(fields)
+        self.ring.append(record)
+        if level < self.level:
+            return
+        if level >= ERROR:
+            self._start_writer()
+            self._queue.put(record)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_emit.get(key, -RATE_LIMIT_SEC) < RATE_LIMIT_SEC:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last_emit[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record = dict(record, suppressed=suppressed)
+        self._start_writer()
+        self._queue.put(record)
+
+    def debug(self, key, msg="", **fields):
+        self.event(DEBUG, key, msg, **fields)
+
+    def info(self, key, msg="", **fields):
+        self.event(INFO, key, msg, **fields)
+
+    def warning(self, key, msg="", **fields):
+        self.event(WARNING, key, msg, **fields)
+
+    def error(self, key, msg="", **fields):
+        self.event(ERROR, key, msg, **fields)
+
+    def count(self, key, n=1):
+        """고빈도 이벤트 집계 (예: 프레임 생성, 프레임 업로드)"""
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + n
+        self._start_writer()
+
+    def _flush_counts(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            suppressed, self._suppressed = self._suppressed, {}
+        for key, total in suppressed.items():
+            # 버스트가 끝나 다음 출력이 없던 이벤트의 생략 건수
+            record = {
+                "ts": round(time.time(), 3),
+                "level": "INFO",
+                "service": self.service,
+                "event": key,
+                "msg": f"최근 {AGGREGATE_INTERVAL_SEC}초 동안 {total}건 생략",
+                "suppressed": total,
+            }
+            self.ring.append(record)
+            self._write(record)
+        for key, total in counts.items():
+            record = {
+                "ts": round(time.time(), 3),
+                "level": "INFO",
+                "service": self.service,
+                "event": key,
+                "msg": f"최근 {AGGREGATE_INTERVAL_SEC}초 동안 {total}건",
+                "count": total,
+                "window_sec": AGGREGATE_INTERVAL_SEC,
+            }
+            self.ring.append(record)
+            if self.level <= INFO:
+                self._write(record)
+
+    def _write(self, record):
+        try:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+        except Exception:
+            pass
+
+    def _run_writer(self):
+        next_flush = time.monotonic() + AGGREGATE_INTERVAL_SEC
+        while True:
+            timeout = max(next_flush - time.monotonic(), 0)
+            try:
+                self._write(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_flush:
+                self._flush_counts()
+                next_flush = time.monotonic() + AGGREGATE_INTERVAL_SEC
+
+    def dump(self, path=None):
+        """링 버퍼를 JSON lines 파일로 저장하고 경로를 반환합니다."""
+        path = path or f"/tmp/{self.service}_events_{int(time.time())}.jsonl"
+        records = list(self.ring)
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return path
+
+    def install_dump_signal(self, signum=signal.SIGUSR1):
+        """kill -USR1 <pid> 로 링 버퍼를 덤프 (메인 스레드에서 호출)"""
+        def handler(sig, frame):
+            # 시그널 핸들러에서 파일 쓰기를 하지 않도록 별도 스레드에서 덤프
+            threading.Thread(target=self._dump_and_report, daemon=True).start()
+        signal.signal(signum, handler)
+
+    def _dump_and_report(self):
+        try:
+            path = self.dump()
+            self.info("event_log_dumped", f"🧾 이벤트 로그 덤프: {path}", path=path, pid=os.getpid())
+        except Exception as e:
+            self.error("event_log_dump_failed", f"❌ 이벤트 로그 덤프 실패: {e}")
+
+
+# 프로세스 전역 이벤트 로그 (통합 에이전트에서는 두 서비스가 같은 인스턴스 사용)
+EVENTS = EventLog()
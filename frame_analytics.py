@@ -0,0 +1,106 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+ACTIVITY_SIZE = (160, 90)  # 움직임 점수 계산용 축소 크기
+
+
+class FrameAnalyzer:
+    """
+    OpenCV DNN (CPU) 으로 프레임 배치를 분석해 프레임별 메타데이터를 만듭니다.
+    모델은 SSD 계열 DetectionOutput ([1, 1, N, 7]: image_id, class_id, confidence,
+    x1, y1, x2, y2 정규화 좌표) 출력을 가정합니다.
+
+    flagged 프레임(검출 또는 움직임이 있는 프레임)과 full_frame_interval 번째 프레임만
+    원본 JPEG 업로드 대상이 됩니다.
+    """
+
+    def __init__(
+        self,
+        model,
+        config=None,
+        input_size=300,
+        confidence=0.5,
+        activity_threshold=0.02,
+        full_frame_interval=10,
+        scale=1 / 127.5,
+        mean=(127.5, 127.5, 127.5),
+    ):
+        self.net = cv2.dnn.readNet(model, config) if config else cv2.dnn.readNet(model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.confidence = confidence
+        self.activity_threshold = activity_threshold
+        self.full_frame_interval = full_frame_interval
+        self.scale = scale
+        self.mean = mean
+        # cv2.dnn.Net 은 스레드 안전하지 않고 움직임 점수는 직전 프레임에 의존하므로 직렬화
+        self._lock = threading.Lock()
+        self._prev_gray = None
+        self._frame_count = 0
+
+    def _activity(self, img):
+        """직전 프레임과의 평균 밝기 차이 (0~1)"""
+        gray = cv2.cvtColor(cv2.resize(img, ACTIVITY_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        prev, self._prev_gray = self._prev_gray, gray
+        if prev is None:
+            return 0.0
+        return float(cv2.absdiff(gray, prev).mean()) / 255.0
+
+    def _detect(self, images):
+        blob = cv2.dnn.blobFromImages(
+            images,
+            scalefactor=self.scale,
+            size=(self.input_size, self.input_size),
+            mean=self.mean,
+            swapRB=True,
+        )
+        self.net.setInput(blob)
+        output = self.net.forward().reshape(-1, 7)
+
+        detections = [[] for _ in images]
+        for image_id, class_id, confidence, x1, y1, x2, y2 in output:
+            if confidence < self.confidence or not 0 <= int(image_id) < len(images):
+                continue
+            x1, y1 = float(np.clip(x1, 0, 1)), float(np.clip(y1, 0, 1))
+            x2, y2 = float(np.clip(x2, 0, 1)), float(np.clip(y2, 0, 1))
+            detections[int(image_id)].append({
+                "class_id": int(class_id),
+                "confidence": round(float(confidence), 3),
+                "box": [round(x1, 4), round(y1, 4), round(x2 - x1, 4), round(y2 - y1, 4)],
+                "center": [round((x1 + x2) / 2, 4), round((y1 + y2) / 2, 4)],
+            })
+        return detections
+
+    def analyze(self, paths):
+        """
+        프레임 파일 배치를 분석합니다.
+        [(path, result dict), ...] 반환, 읽을 수 없는 프레임은 제외
+        """
+        with self._lock:
+            loaded = []
+            for path in paths:
+                img = cv2.imread(path)
+                if img is not None:
+                    loaded.append((path, img))
+            if not loaded:
+                return []
+
+            detections = self._detect([img for _, img in loaded])
+            results = []
+            for (path, img), dets in zip(loaded, detections):
+                activity = self._activity(img)
+                self._frame_count += 1
+                sampled = self.full_frame_interval > 0 and self._frame_count % self.full_frame_interval == 0
+                flagged = bool(dets) or activity >= self.activity_threshold
+                results.append((path, {
+                    "frame": os.path.splitext(os.path.basename(path))[0],
+                    "detections": dets,
+                    "activity": round(activity, 4),
+                    "flagged": flagged,
+                    "upload_image": flagged or sampled,
+                }))
+            return results
@@ -0,0 +1,83 @@
+import os
+
+import cv2
+
+DEFAULT_JPEG_QUALITY = 80
+
+
+def parse_roi(value):
+    """'x,y,w,h' 문자열을 (x, y, w, h) 로 변환 (argparse type 용)"""
+    parts = [int(v) for v in value.split(",")]
+    if len(parts) != 4 or parts[2] <= 0 or parts[3] <= 0:
+        raise ValueError(f"잘못된 ROI: {value}")
+    return tuple(parts)
+
+
+def _fit(img, max_width, max_height):
+    """비율을 유지하며 최대 크기 안으로 축소 (확대하지 않음)"""
+    h, w = img.shape[:2]
+    scale = 1.0
+    if max_width:
+        scale = min(scale, max_width / w)
+    if max_height:
+        scale = min(scale, max_height / h)
+    if scale >= 1.0:
+        return img
+    size = (max(int(w * scale), 1), max(int(h * scale), 1))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+class FramePreprocessor:
+    """
+    업로드 전 프레임 전처리: ROI 잘라내기 → 축소 → JPEG 재인코딩
+    ROI 가 여러 개면 같은 높이로 맞춰 가로로 이어 붙여 한 장으로 만듭니다.
+    (서버의 SN_TIMESTAMP.jpg 파일명 규칙을 그대로 유지하기 위함)
+    """
+
+    def __init__(self, rois=None, max_width=None, max_height=None, quality=DEFAULT_JPEG_QUALITY):
+        self.rois = rois or []
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+
+    def _crop(self, img):
+        h, w = img.shape[:2]
+        crops = []
+        for x, y, rw, rh in self.rois:
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + rw, w), min(y + rh, h)
+            if x1 > x0 and y1 > y0:
+                crops.append(img[y0:y1, x0:x1])
+        if not crops:
+            return img
+        if len(crops) == 1:
+            return crops[0]
+
+        height = min(c.shape[0] for c in crops)
+        resized = [
+            cv2.resize(c, (max(int(c.shape[1] * height / c.shape[0]), 1), height), interpolation=cv2.INTER_AREA)
+            if c.shape[0] != height else c
+            for c in crops
+        ]
+        return cv2.hconcat(resized)
+
+    def process(self, path):
+        """
+        프레임 파일을 제자리에서 전처리합니다.
+        (원본 크기, 처리 후 크기) 반환, 읽기/인코딩 실패 시 None
+        """
+        before = os.path.getsize(path)
+        img = cv2.imread(path)
+        if img is None:
+            return None
+
+        out = _fit(self._crop(img), self.max_width, self.max_height)
+        ok, encoded = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return None
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+        return before, len(encoded)
@@ -0,0 +1,88 @@
+import os
+import re
+import shutil
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+HLS_SINK = "hlscmafsink"  # gst-plugins-rs (hlssink3), fMP4/CMAF 세그먼트 + 플레이리스트
+HEVC_CODECS = "hvc1.1.6.L93.B0"  # Main, 720p
+H264_CODECS = "avc1.64001f"  # High, L3.1
+
+MIME_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+def hls_available():
+    return Gst.ElementFactory.find(HLS_SINK) is not None
+
+
+def gop_frames(framerate, seconds):
+    """세그먼트는 키프레임에서만 나뉘므로 GOP 를 세그먼트 길이에 맞춤 (framerate 는 '30/1' 형식)"""
+    num, _, den = framerate.partition("/")
+    return max(1, round(int(num) / int(den or 1) * seconds))
+
+
+def with_gop(encoder_options, gop):
+    """인코더 옵션에 gop 가 없으면 추가"""
+    if re.search(r"\bgop=", encoder_options):
+        return encoder_options
+    return f"{encoder_options} gop={gop}"
+
+
+def _bitrate(encoder_options, default):
+    match = re.search(r"\bbps=(\d+)", encoder_options)
+    return int(match.group(1)) if match else default
+
+
+def hls_sink(output_dir, target_duration, playlist_length):
+    """렌디션 하나의 hlscmafsink 파이프라인 조각 (tmpfs 링: 오래된 세그먼트 파일은 자동 삭제)"""
+    return (
+        f"{HLS_SINK} "
+        f"location={os.path.join(output_dir, 'segment%05d.m4s')} "
+        f"init-location={os.path.join(output_dir, 'init%05d.mp4')} "
+        f"playlist-location={os.path.join(output_dir, 'playlist.m3u8')} "
+        f"target-duration={target_duration} "
+        f"playlist-length={playlist_length} "
+        f"max-num-segment-files={playlist_length * 2}"
+    )
+
+
+def prepare_hls_dir(hls_dir, hevc_options, hevc_size, h264=None):
+    """
+    HLS 출력 폴더를 비우고 master.m3u8 을 작성합니다.
+    h264 는 (encoder_options, width, height) 또는 None
+    """
+    shutil.rmtree(hls_dir, ignore_errors=True)
+    os.makedirs(os.path.join(hls_dir, "hevc"), exist_ok=True)
+    if h264:
+        os.makedirs(os.path.join(hls_dir, "h264"), exist_ok=True)
+    write_master_playlist(hls_dir, hevc_options, hevc_size, h264)
+
+
+def write_master_playlist(hls_dir, hevc_options, hevc_size, h264=None):
+    """master.m3u8 작성 (설정 변경 시 해상도/비트레이트 갱신용, 세그먼트는 유지)"""
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f'#EXT-X-STREAM-INF:BANDWIDTH={_bitrate(hevc_options, 51200000)},RESOLUTION={hevc_size[0]}x{hevc_size[1]},CODECS="{HEVC_CODECS}"',
+        "hevc/playlist.m3u8",
+    ]
+    if h264:
+        options, width, height = h264
+        lines += [
+            f'#EXT-X-STREAM-INF:BANDWIDTH={_bitrate(options, 4000000)},RESOLUTION={width}x{height},CODECS="{H264_CODECS}"',
+            "h264/playlist.m3u8",
+        ]
+
+    # 플레이어가 쓰다 만 파일을 읽지 않도록 임시 파일 후 교체
+    master_path = os.path.join(hls_dir, "master.m3u8")
+    with open(master_path + ".tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(master_path + ".tmp", master_path)
@@ -0,0 +1,112 @@
+import socket
+import struct
+import threading
+
+from event_log import EVENTS
+
+# rtnetlink 멀티캐스트 그룹 / 메시지 타입 (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTM_NEWLINK, RTM_DELLINK = 16, 17
+RTM_NEWADDR, RTM_DELADDR = 20, 21
+RTM_NEWROUTE, RTM_DELROUTE = 24, 25
+WATCHED_TYPES = {
+    RTM_NEWLINK, RTM_DELLINK,
+    RTM_NEWADDR, RTM_DELADDR,
+    RTM_NEWROUTE, RTM_DELROUTE,
+}
+NLMSG_HEADER = struct.Struct("=IHHII")
+RTF_UP = 0x1
+
+
+def get_local_ip():
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except:
+        return None
+
+
+def has_default_route():
+    """/proc/net/route 에 활성화된 기본 경로(0.0.0.0/0)가 있는지 확인"""
+    try:
+        with open("/proc/net/route", "r") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 8 and fields[1] == "00000000" and fields[7] == "00000000":
+                    if int(fields[3], 16) & RTF_UP:
+                        return True
+    except Exception:
+        pass
+    return False
+
+
+class NetworkMonitor:
+    """
+    rtnetlink 이벤트(링크/주소/경로 변경)를 받아 IP 및 연결 상태 변화를 알려줍니다.
+    리스너는 listener(ip, online) 형태로 모니터 스레드에서 호출됩니다.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self.ip = get_local_ip()
+        self.online = has_default_route()
+        self.sock = None
+        self.thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self.sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        except OSError as e:
+            print(f"❌ 네트워크 모니터 시작 실패: {e}")
+            self.sock = None
+            return False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def _run(self):
+        while self.sock:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            if self._has_watched_message(data):
+                self._refresh()
+
+    def _has_watched_message(self, data):
+        offset = 0
+        while offset + NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+            if msg_type in WATCHED_TYPES:
+                return True
+            if length < NLMSG_HEADER.size:
+                break
+            offset += (length + 3) & ~3
+        return False
+
+    def _refresh(self):
+        online = has_default_route()
+        ip = get_local_ip() if online else None
+        if ip == self.ip and online == self.online:
+            return
+        self.ip, self.online = ip, online
+        for listener in self.listeners:
+            try:
+                listener(ip, online)
+            except Exception as e:
+                EVENTS.error("network_listener_failed", f"❌ 네트워크 변경 처리 오류: {e}")
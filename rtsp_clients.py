@@ -0,0 +1,212 @@
+import argparse
+import socket
+import struct
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstRtsp", "1.0")
+gi.require_version("GstRtspServer", "1.0")
+from gi.repository import Gst, GLib, GstRtsp, GstRtspServer
+
+from event_log import EVENTS
+
+STATS_INTERVAL_SEC = 5
+TCP_INFO_BYTES_ACKED_OFFSET = 120  # struct tcp_info 의 tcpi_bytes_acked 위치 (linux/tcp.h)
+
+RTSP_PROTOCOLS = {
+    "udp": GstRtsp.RTSPLowerTrans.UDP,
+    "udp-mcast": GstRtsp.RTSPLowerTrans.UDP_MCAST,
+    "tcp": GstRtsp.RTSPLowerTrans.TCP,
+}
+
+
+def parse_protocols(value):
+    """'udp,udp-mcast,tcp' 형식을 RTSPLowerTrans 플래그로 변환"""
+    flags = GstRtsp.RTSPLowerTrans(0)
+    for name in value.split(","):
+        name = name.strip()
+        if name not in RTSP_PROTOCOLS:
+            raise ValueError(f"알 수 없는 RTSP 전송 방식: {name!r} (가능: {', '.join(RTSP_PROTOCOLS)})")
+        flags |= RTSP_PROTOCOLS[name]
+    return flags
+
+
+def protocols_arg(value):
+    """argparse type: --rtsp-protocols 값을 검증하고 문자열 그대로 반환"""
+    try:
+        parse_protocols(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def create_multicast_pool(address_range, port_range, ttl):
+    """'224.3.0.1-224.3.0.10', '5000-5100' 형식의 범위로 멀티캐스트 주소 풀 생성"""
+    addr_min, _, addr_max = address_range.partition("-")
+    port_min, _, port_max = port_range.partition("-")
+    pool = GstRtspServer.RTSPAddressPool()
+    if not pool.add_range(addr_min, addr_max or addr_min, int(port_min), int(port_max or port_min), ttl):
+        raise ValueError(f"잘못된 멀티캐스트 범위: {address_range} / {port_range}")
+    return pool
+
+
+def _tcp_bytes_acked(gio_socket):
+    """RTSP 연결 소켓에서 상대가 확인(ACK)한 누적 바이트 수 (interleaved TCP 전송량)"""
+    try:
+        sock = socket.fromfd(gio_socket.get_fd(), socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+        finally:
+            sock.close()
+        if len(info) < TCP_INFO_BYTES_ACKED_OFFSET + 8:
+            return None
+        return struct.unpack_from("=Q", info, TCP_INFO_BYTES_ACKED_OFFSET)[0]
+    except Exception:
+        return None
+
+
+class RtspClientMonitor:
+    """
+    RTSP 클라이언트 접속 관리
+    - max_clients 를 넘는 DESCRIBE/SETUP 요청은 503 으로 거절
+      (세션이 있는 클라이언트만 계산하므로 거절된 연결은 포함되지 않음)
+    - tcp_send_buffer 가 지정되면 클라이언트 소켓의 SO_SNDBUF 제한
+    - 클라이언트별 전송 방식과 비트레이트를 STATS_INTERVAL_SEC 마다 계산
+      interleaved TCP 는 소켓의 tcpi_bytes_acked 로 클라이언트별 bitrate_bps 를 측정하고,
+      UDP/멀티캐스트는 클라이언트별 측정값이 없어 공유 스트림의 stream_bitrate_bps 만 표시
+    """
+
+    def __init__(self, server, factory, max_clients=0, tcp_send_buffer=0):
+        self.max_clients = max_clients
+        self.tcp_send_buffer = tcp_send_buffer
+        self.clients = {}
+        self.stream_bytes = 0
+        self.stream_bitrate = 0
+        self.stats = {"stream_bitrate_bps": 0, "clients": []}
+        self._last_stats_time = time.monotonic()
+        self._last_stream_bytes = 0
+        self.stats_source = None
+
+        server.connect("client-connected", self._on_client_connected)
+        factory.connect("media-configure", self._on_media_configure)
+
+    def start(self):
+        self.stats_source = GLib.timeout_add_seconds(STATS_INTERVAL_SEC, self._update_stats)
+
+    def stop(self):
+        if self.stats_source:
+            GLib.source_remove(self.stats_source)
+            self.stats_source = None
+
+    def _on_media_configure(self, factory, media):
+        pay = media.get_element().get_by_name("pay0")
+        if pay:
+            pay.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_payload_buffer)
+
+    def _on_payload_buffer(self, pad, info):
+        self.stream_bytes += info.get_buffer().get_size()
+        return Gst.PadProbeReturn.OK
+
+    def _on_client_connected(self, server, client):
+        conn = client.get_connection()
+        if self.tcp_send_buffer:
+            try:
+                conn.get_write_socket().set_option(socket.SOL_SOCKET, socket.SO_SNDBUF, self.tcp_send_buffer)
+            except Exception as e:
+                EVENTS.warning("rtsp_sndbuf_failed", f"⚠️ 송신 버퍼 설정 실패: {e}")
+
+        self.clients[client] = {
+            "ip": conn.get_ip(),
+            "transport": None,
+            "connected_at": time.time(),
+            "tcp_bytes": _tcp_bytes_acked(conn.get_read_socket()) or 0,
+            "bitrate_bps": 0,
+            "active": False,  # SETUP 으로 세션이 만들어진 클라이언트
+        }
+        client.connect("closed", self._on_client_closed)
+        client.connect("pre-describe-request", self._on_pre_describe)
+        client.connect("pre-setup-request", self._on_pre_setup)
+        client.connect("new-session", self._on_new_session)
+        client.connect("teardown-request", self._on_teardown_request)
+        client.connect("setup-request", self._on_setup_request)
+        EVENTS.info("rtsp_client_connected", f"👀 RTSP 클라이언트 접속: {conn.get_ip()}", ip=conn.get_ip(), clients=len(self.clients))
+
+    def _on_client_closed(self, client):
+        info = self.clients.pop(client, None)
+        if info:
+            EVENTS.info("rtsp_client_closed", f"👋 RTSP 클라이언트 종료: {info['ip']}", ip=info["ip"], clients=len(self.clients))
+
+    def _active_count(self):
+        return sum(1 for info in self.clients.values() if info["active"])
+
+    def _check_limit(self, client, request):
+        info = self.clients.get(client)
+        # 이미 세션이 있는 클라이언트의 추가 요청(다른 스트림 SETUP 등)은 허용
+        if not self.max_clients or (info and info["active"]):
+            return GstRtsp.RTSPStatusCode.OK
+        if self._active_count() >= self.max_clients:
+            ip = info["ip"] if info else "?"
+            EVENTS.warning("rtsp_client_rejected", f"⚠️ 최대 클라이언트 수 초과, {request} 거절: {ip}", ip=ip)
+            return GstRtsp.RTSPStatusCode.SERVICE_UNAVAILABLE
+        return GstRtsp.RTSPStatusCode.OK
+
+    def _on_pre_describe(self, client, ctx):
+        return self._check_limit(client, "DESCRIBE")
+
+    def _on_pre_setup(self, client, ctx):
+        # DESCRIBE 없이 바로 SETUP 하는 클라이언트도 제한
+        return self._check_limit(client, "SETUP")
+
+    def _on_new_session(self, client, session):
+        if client in self.clients:
+            self.clients[client]["active"] = True
+
+    def _on_teardown_request(self, client, ctx):
+        if client in self.clients:
+            self.clients[client]["active"] = False
+
+    def _on_setup_request(self, client, ctx):
+        res, transport = ctx.request.get_header(GstRtsp.RTSPHeaderField.TRANSPORT, 0)
+        if res != GstRtsp.RTSPResult.OK or client not in self.clients:
+            return
+        if "RTP/AVP/TCP" in transport or "interleaved" in transport:
+            kind = "tcp"
+        elif "multicast" in transport:
+            kind = "udp-mcast"
+        else:
+            kind = "udp"
+        self.clients[client]["transport"] = kind
+
+    def _update_stats(self):
+        now = time.monotonic()
+        elapsed = max(now - self._last_stats_time, 1e-3)
+        stream_bytes = self.stream_bytes
+        self.stream_bitrate = int((stream_bytes - self._last_stream_bytes) * 8 / elapsed)
+        self._last_stream_bytes = stream_bytes
+        self._last_stats_time = now
+
+        clients = []
+        for client, info in list(self.clients.items()):
+            entry = {
+                "ip": info["ip"],
+                "transport": info["transport"],
+                "connected_sec": int(time.time() - info["connected_at"]),
+            }
+            if info["transport"] == "tcp":
+                acked = _tcp_bytes_acked(client.get_connection().get_read_socket())
+                if acked is not None:
+                    info["bitrate_bps"] = int((acked - info["tcp_bytes"]) * 8 / elapsed)
+                    info["tcp_bytes"] = acked
+                entry["bitrate_bps"] = info["bitrate_bps"]
+            else:
+                # UDP 는 클라이언트별 송신량을 알 수 없으므로 공유 스트림 비트레이트로 구분해 표시
+                entry["stream_bitrate_bps"] = self.stream_bitrate
+            clients.append(entry)
+
+        # HTTP 스레드에서 읽으므로 새 dict 로 교체
+        self.stats = {"stream_bitrate_bps": self.stream_bitrate, "clients": clients}
+        if clients:
+            EVENTS.debug("rtsp_client_stats", f"📊 RTSP 클라이언트 {len(clients)}명", **self.stats)
+        return True
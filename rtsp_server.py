@@ -6,16 +6,24 @@ import logging
 import os
 import shutil
 import time
+import threading
 import fcntl  # 파일 잠금 추가
 from datetime import datetime, timezone, timedelta
-from pathlib import Path
-import socket
 import requests
 import json
 
 gi.require_version("Gst", "1.0")
 gi.require_version("GstRtspServer", "1.0")
-from gi.repository import Gst, GLib, GstRtspServer
+from gi.repository import Gst, GLib, GObject, GstRtspServer
+
+from device_identity import DeviceIdentity
+from event_log import EVENTS, LEVELS
+from net_monitor import NetworkMonitor, get_local_ip
+from segment_index import SegmentIndex
+from clip_server import ClipServer, LiveServer
+from control_server import ControlServer, format_options, parse_options
+from hls_output import gop_frames, hls_available, hls_sink, prepare_hls_dir, with_gop, write_master_playlist
+from rtsp_clients import RtspClientMonitor, create_multicast_pool, parse_protocols, protocols_arg
 
 logging.disable(logging.CRITICAL)
 
@@ -25,16 +33,15 @@ RTSP_PORT = 8554
 RTSP_PATH = "stream"
 LOCK_FILE = "/home/radxa/video_processing.lock"  # 파일 처리 동기화를 위한 잠금 파일
 
+# 녹화 파이프라인 감시 설정
+STALL_TIMEOUT_SEC = 5  # 이 시간 동안 버퍼가 없으면 정지로 판단
+FINALIZE_TIMEOUT_SEC = 3  # 재시작 전 현재 세그먼트 마무리 대기 최대 시간
+RECOVERY_RETRY_SEC = 2  # 마무리할 세그먼트가 없을 때 재시작 간격
 
-def get_local_ip():
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return None
+# 네트워크 복구 직후 DNS/DHCP 가 준비되지 않았을 때 디바이스 재등록 재시도 간격
+REREGISTER_RETRY_MIN_SEC = 2
+REREGISTER_RETRY_MAX_SEC = 60
+SEGMENT_SECONDS = 60  # 기본 세그먼트 길이 (1분 경계 정렬, 다른 길이는 시작 시각으로 이름 지정)
 
 
 def register_device(ip):
@@ -65,26 +72,102 @@ def update_device(sn, ip):
         return None
 
 
+DEVICE_IDENTITY = DeviceIdentity([SN_FILE])
+
+
 def save_sn(sn):
-    try:
-        with open(SN_FILE, "w") as f:
-            f.write(sn)
-        return True
-    except:
-        return False
+    return DEVICE_IDENTITY.save(sn)
 
 
 def load_sn():
-    try:
-        sn_path = Path(SN_FILE)
-        if sn_path.exists():
-            return sn_path.read_text().strip()
-    except:
-        pass
-    return "UNKNOWN"
+    return DEVICE_IDENTITY.sn
+
+
+def register_or_update_device(ip):
+    """기존 SN 이 있으면 IP 를 갱신하고, 없으면 새로 등록합니다. 유효한 SN 반환 (실패 시 None)"""
+    sn = load_sn()
+    if sn and sn != "UNKNOWN":
+        print(f"✅ 기존 SN 확인: {sn}")
+        update_device(sn, ip)
+        return sn
+
+    print("ℹ️ SN 없음, 새로 등록 시도")
+    result = register_device(ip)
+    if not result:
+        print("❌ 디바이스 등록 실패")
+        return None
+    new_sn = result.get("serial_number")
+    if not new_sn:
+        print("❌ SN 응답 없음")
+        return None
+    save_sn(new_sn)
+    print(f"✅ 새 SN 등록 완료: {new_sn}")
+    return new_sn
+
+
+# 네트워크 모니터 리스너: IP 가 바뀌거나 연결이 복구되면 rtsp_url 재등록
+# 갱신 요청(최대 10초)이 모니터 스레드와 다른 리스너를 막지 않도록 별도 스레드에서 실행
+# 실패하면 성공하거나 네트워크 상태가 다시 바뀔 때까지 재시도 (이전 스레드는 세대 번호로 중단)
+_reregister_generation = 0
+
+
+def reregister_device(ip, online):
+    global _reregister_generation
+    _reregister_generation += 1
+    threading.Thread(
+        target=_reregister_device, args=(ip, online, _reregister_generation), daemon=True
+    ).start()
+
+
+def _reregister_device(ip, online, generation):
+    if not online or not ip:
+        EVENTS.warning("network_down", "⚠️ 네트워크 연결 끊김")
+        return
+    EVENTS.info("network_changed", f"🌐 네트워크 변경 감지 (IP: {ip}), 디바이스 정보 갱신", ip=ip)
+    delay = REREGISTER_RETRY_MIN_SEC
+    while generation == _reregister_generation:
+        sn = load_sn()
+        if sn == "UNKNOWN":
+            return
+        if update_device(sn, ip) is not None:
+            return
+        EVENTS.error("device_update_failed", f"❌ 디바이스 정보 갱신 실패, {delay}초 후 재시도", ip=ip, retry_sec=delay)
+        time.sleep(delay)
+        delay = min(delay * 2, REREGISTER_RETRY_MAX_SEC)
+
+
+# 설정 값 검증 (CLI 와 설정 변경 API 가 같은 규칙 사용)
+def parse_fraction(value):
+    """'30/1' 형식 검증 후 정규화된 문자열 반환"""
+    num, _, den = str(value).partition("/")
+    den = den or "1"
+    if not num.isdigit() or not den.isdigit() or not int(num) or not int(den):
+        raise ValueError(f"잘못된 프레임레이트: {value} (예: 30/1)")
+    return f"{int(num)}/{int(den)}"
 
 
-DEVICE_SN = load_sn()
+def parse_frame_rate(value):
+    # 프레임 파일 이름이 초 단위이므로 초당 1장 이하만 허용
+    rate = parse_fraction(value)
+    num, den = rate.split("/")
+    if int(num) > int(den):
+        raise ValueError(f"frame_rate 는 1/1 이하 (예: 1/2): {value}")
+    return rate
+
+
+def parse_positive_int(value):
+    if isinstance(value, bool) or int(value) != float(value) or int(value) < 1:
+        raise ValueError(f"1 이상의 정수여야 함: {value}")
+    return int(value)
+
+
+def _arg_type(parse):
+    def convert(value):
+        try:
+            return parse(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return convert
 
 
 # 정확한 현재 시간 타임스탬프 생성 (KST 기준)
@@ -137,6 +220,7 @@ def with_file_lock(func):
 
 
 # GStreamer 버스 메시지 콜백 함수 (현재 시간 기준 파일명 생성)
+# user_data 가 호출 가능하면 이름이 바뀐 프레임 경로를 전달 (통합 에이전트의 업로드 큐)
 def frame_file_created_callback(bus, message, user_data):
     if message.type == Gst.MessageType.ELEMENT:
         structure = message.get_structure()
@@ -149,7 +233,7 @@ def frame_file_created_callback(bus, message, user_data):
                     
                 # 기존 frame_XXXXX.jpg 파일을 SN_TIMESTAMP.jpg 형식으로 직접 변경
                 timestamp = get_current_timestamp()
-                new_filename = os.path.join(os.path.dirname(filename), f"{DEVICE_SN}_{timestamp}.jpg")
+                new_filename = os.path.join(os.path.dirname(filename), f"{load_sn()}_{timestamp}.jpg")
                 
                 try:
                     # 동일 이름의 파일이 있으면 삭제
@@ -157,9 +241,11 @@ def frame_file_created_callback(bus, message, user_data):
                         os.remove(new_filename)
                     # 파일 이동
                     shutil.move(filename, new_filename)
-                    print(f"✅ 프레임 생성: {os.path.basename(new_filename)}")
+                    EVENTS.count("frame_written")
+                    if callable(user_data):
+                        user_data(new_filename)
                 except Exception as e:
-                    print(f"❌ 프레임 이름 변경 실패: {filename} -> {new_filename} - {e}")
+                    EVENTS.error("frame_rename_failed", f"❌ 프레임 이름 변경 실패: {filename} -> {new_filename} - {e}")
 
 
 class TeeRtspMediaFactory(GstRtspServer.RTSPMediaFactory):
@@ -169,20 +255,51 @@ class TeeRtspMediaFactory(GstRtspServer.RTSPMediaFactory):
         encoder_options="bps=51200000 rc-mode=vbr",
         payload="rtph265pay",
         pt=97,
+        protocols=None,
+        address_pool=None,
     ):
         super().__init__()
         self.encoder = encoder
         self.encoder_options = encoder_options
         self.payload = payload
         self.pt = pt
-        self.launch_string = (
+        # 허용 전송 방식 (UDP / UDP 멀티캐스트 / interleaved TCP)
+        if protocols is not None:
+            self.set_protocols(protocols)
+        # 멀티캐스트 주소 풀: 공유 미디어에서 LAN 시청자들이 그룹 하나를 함께 받음
+        if address_pool is not None:
+            self.set_address_pool(address_pool)
+        # 실행 중 인코더 속성 변경을 위해 준비된 미디어 추적
+        self.medias = []
+        self.connect("media-configure", self._on_media_configure)
+
+    @property
+    def launch_string(self):
+        return (
             "intervideosrc channel=cam ! queue leaky=downstream max-size-buffers=5 ! "
-            "{0} {1} ! {2} name=pay0 pt={3}"
+            "{0} name=enc {1} ! {2} name=pay0 pt={3}"
         ).format(self.encoder, self.encoder_options, self.payload, self.pt)
 
     def do_create_element(self, url):
         return Gst.parse_launch(self.launch_string)
 
+    def _on_media_configure(self, factory, media):
+        self.medias.append(media)
+        media.connect("unprepared", self._on_media_unprepared)
+
+    def _on_media_unprepared(self, media):
+        if media in self.medias:
+            self.medias.remove(media)
+
+    def update_encoder(self, encoder_options, changes):
+        """새 미디어에 쓸 옵션을 바꾸고, 재생 중인 미디어의 인코더 속성은 바로 변경"""
+        self.encoder_options = encoder_options
+        for media in self.medias:
+            enc = media.get_element().get_by_name("enc")
+            if enc:
+                for name, value in changes.items():
+                    Gst.util_set_object_arg(enc, name, value)
+
 
 class RtspRecordingService:
     def __init__(
@@ -196,6 +313,35 @@ class RtspRecordingService:
         pt=97,
         record_path="/home/radxa/Videos",
         frame_path="/home/radxa/Frames",
+        clip_port=8555,
+        clip_host="127.0.0.1",
+        clip_token=None,
+        on_segment_ready=None,
+        on_frame_ready=None,
+        rtsp_protocols="udp,udp-mcast,tcp",
+        multicast_range="224.3.0.1-224.3.0.10",
+        multicast_ports="5000-5100",
+        multicast_ttl=16,
+        tcp_send_buffer=0,
+        max_clients=0,
+        rtsp_backlog=2,
+        hls_dir=None,
+        hls_target_duration=1,
+        hls_playlist_length=6,
+        hls_h264=False,
+        hls_h264_encoder="mpph264enc",
+        hls_h264_options="bps=4000000 rc-mode=cbr",
+        hls_h264_width=1280,
+        hls_h264_height=720,
+        hls_port=8556,
+        hls_host="0.0.0.0",
+        hls_token=None,
+        width=1280,
+        height=720,
+        framerate="30/1",
+        frame_rate="1/1",
+        segment_seconds=SEGMENT_SECONDS,
+        control_socket="/tmp/rtsp_control.sock",
     ):
 
         self.device = device
@@ -207,19 +353,87 @@ class RtspRecordingService:
         self.pt = pt
         self.record_path = record_path
         self.frame_path = frame_path
+
+        # 실행 중 변경 가능한 설정 (control_server)
+        # 카메라 해상도/프레임레이트는 다음 세그먼트 경계에서 파이프라인을 다시 만들어 적용
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.frame_rate = frame_rate
+        self.segment_seconds = segment_seconds
+        self.restart_source = None
+        # 재구성한 파이프라인이 인코딩 버퍼를 내기 전까지는 미확인, 실패하면 마지막 정상 설정으로 복귀
+        self.good_config = None
+        self.pipeline_confirmed = False
+        self.encoded_seen = False
+        self.control_server = ControlServer(control_socket, self._handle_control) if control_socket else None
+
+        # 통합 에이전트에서 업로더로 완료된 파일을 바로 넘기기 위한 콜백
+        self.on_segment_ready = on_segment_ready
+        self.on_frame_ready = on_frame_ready
         
         # 업로드 관련 정보를 저장할 파일
         self.upload_info_file = os.path.join(record_path, ".upload_tracker")
 
+        # 로컬 세그먼트 인덱스 및 클립 서버 (clip_port=0 이면 비활성화)
+        self.segment_index = SegmentIndex(os.path.join(record_path, ".segment_index"))
+        self.segment_open_times = {}  # 임시 파일 경로: 세그먼트 시작 시각 (epoch)
         Gst.init(None)
         self.server = GstRtspServer.RTSPServer()
         self.server.set_service(self.port)
-        self.server.props.backlog = 2
+        self.server.props.backlog = rtsp_backlog
 
-        self.factory = TeeRtspMediaFactory(encoder, encoder_options, payload, pt)
+        address_pool = None
+        if "udp-mcast" in rtsp_protocols:
+            address_pool = create_multicast_pool(multicast_range, multicast_ports, multicast_ttl)
+        self.factory = TeeRtspMediaFactory(
+            encoder,
+            encoder_options,
+            payload,
+            pt,
+            protocols=parse_protocols(rtsp_protocols),
+            address_pool=address_pool,
+        )
         self.factory.set_shared(True)
         self.server.get_mount_points().add_factory(self.mount, self.factory)
 
+        # 브라우저용 LL-HLS (fMP4) 출력: 녹화용 H.265 비트스트림을 그대로 재사용
+        # hls_dir 을 비우면 비활성화, 선택적으로 H.264 렌디션 추가
+        self.hls_dir = hls_dir
+        self.hls_target_duration = hls_target_duration
+        self.hls_playlist_length = hls_playlist_length
+        self.hls_h264 = hls_h264
+        self.hls_h264_encoder = hls_h264_encoder
+        self.hls_h264_options = hls_h264_options
+        self.hls_h264_size = (hls_h264_width, hls_h264_height)
+        self.hls_h264_variant = (hls_h264_options, hls_h264_width, hls_h264_height) if hls_h264 else None
+        if self.hls_dir and not hls_available():
+            print("⚠️ hlscmafsink 없음 (gst-plugins-rs), HLS 출력 비활성화")
+            self.hls_dir = None
+        if self.hls_dir and not hls_port:
+            print("⚠️ HLS 서버 포트가 없어 제공할 수 없음, HLS 출력 비활성화 (--hls-port)")
+            self.hls_dir = None
+        self.live_server = None
+        if self.hls_dir:
+            prepare_hls_dir(self.hls_dir, self.encoder_options, (width, height), self.hls_h264_variant)
+            # 클립 서버(녹화 원본)와 분리된 주소/포트/토큰으로 라이브만 제공
+            self.live_server = LiveServer(self.hls_dir, hls_port, host=hls_host, token=hls_token)
+
+        # 클라이언트 수 제한, 송신 버퍼, 클라이언트별 비트레이트
+        self.client_monitor = RtspClientMonitor(
+            self.server, self.factory, max_clients=max_clients, tcp_send_buffer=tcp_send_buffer
+        )
+
+        self.clip_server = None
+        if clip_port:
+            self.clip_server = ClipServer(
+                self.segment_index,
+                clip_port,
+                stats_provider=lambda: self.client_monitor.stats,
+                host=clip_host,
+                token=clip_token,
+            )
+
         os.makedirs(self.record_path, exist_ok=True)
         os.makedirs(self.frame_path, exist_ok=True)
         
@@ -234,13 +448,20 @@ class RtspRecordingService:
         # 다음 1분 간격까지 대기
         wait_until_next_one_minute()
         
+        # 파이프라인 감시 상태
+        self._reset_stall_timers()
+        self.current_segment = None  # 현재 기록 중인 임시 세그먼트 경로
+        self.segment_count = 0  # 재시작 후에도 임시 파일 번호가 겹치지 않도록 유지
+        self.unaligned_segments = set()  # 1분 경계에서 시작/종료되지 않은 세그먼트
+        self.recovering = False
+        self.realign_pending = False
+        self.realign_source = None
+        self.watchdog_source = None
+        self.rebuild_source = None
+
         # 녹화 파이프라인 생성
         self.record_pipeline = self._create_record_pipeline()
-
-        # 프레임 생성 콜백 연결
-        self.record_pipeline.get_bus().add_signal_watch()
-        self.record_pipeline.get_bus().connect("message", frame_file_created_callback, None)
-        self.record_pipeline.get_bus().connect("message::element", self._on_element_message)
+        self._attach_record_pipeline()
 
         self.loop = GLib.MainLoop()
 
@@ -278,28 +499,279 @@ class RtspRecordingService:
         # GStreamer에서는 고유한 이름으로 만들고 메시지 핸들러에서 이름 변경
         frame_pattern = os.path.join(self.frame_path, "%d.jpg")
         
+        # HLS 가 켜져 있으면 인코딩된 H.265 를 tee 로 나눠 녹화와 HLS 가 함께 사용
+        encoder_options = self.encoder_options
+        encoded_tee = ""
+        hls_branches = ""
+        if self.hls_dir:
+            gop = gop_frames(self.framerate, self.hls_target_duration)
+            encoder_options = with_gop(encoder_options, gop)
+            encoded_tee = "tee name=et et. ! queue ! "
+            # 인코딩된 스트림에서 임의 프레임을 버리면 다음 IDR 까지 깨지므로 leaky 없이 시간 제한만 둠
+            hls_branches = (
+                " et. ! queue max-size-buffers=0 max-size-bytes=0 max-size-time=2000000000 ! "
+                "h265parse ! video/x-h265,stream-format=hvc1,alignment=au ! "
+                + hls_sink(os.path.join(self.hls_dir, "hevc"), self.hls_target_duration, self.hls_playlist_length)
+            )
+            if self.hls_h264:
+                width, height = self.hls_h264_size
+                hls_branches += (
+                    " t. ! queue leaky=downstream max-size-buffers=5 ! "
+                    f"videoscale ! video/x-raw,width={width},height={height} ! "
+                    f"{self.hls_h264_encoder} {with_gop(self.hls_h264_options, gop)} ! "
+                    "h264parse ! video/x-h264,stream-format=avc,alignment=au ! "
+                    + hls_sink(os.path.join(self.hls_dir, "h264"), self.hls_target_duration, self.hls_playlist_length)
+                )
+
         pipeline_str = (
             f"v4l2src device={self.device} ! "
-            "videorate ! video/x-raw,format=NV12,width=1280,height=720,framerate=30/1 ! " "videoflip method=rotate-180 ! "  
+            f"videorate ! video/x-raw,format=NV12,width={self.width},height={self.height},framerate={self.framerate} ! " "videoflip method=rotate-180 ! "  
             "tee name=t "
             "t. ! queue leaky=downstream max-size-buffers=5 ! "
-            f"{self.encoder} {self.encoder_options} ! h265parse ! "
-            "splitmuxsink name=smux muxer=mp4mux async-finalize=true location={} max-size-time=60000000000 "  # 1분 = 60초 = 60,000,000,000 나노초
+            f"{self.encoder} name=enc {encoder_options} ! h265parse ! {encoded_tee}"
+            f"splitmuxsink name=smux muxer=mp4mux async-finalize=true start-index={self.segment_count} "
+            f"location={{}} max-size-time={self.segment_seconds * Gst.SECOND} "  # 기본 1분 = 60,000,000,000 나노초
             "t. ! queue leaky=downstream max-size-buffers=5 ! "
-            "videorate ! video/x-raw,framerate=1/1 ! jpegenc ! multifilesink location={} post-messages=true "
+            f"videorate ! capsfilter name=frame_caps caps=video/x-raw,framerate={self.frame_rate} ! "
+            "jpegenc ! multifilesink location={} post-messages=true "
             "t. ! queue leaky=downstream max-size-buffers=5 ! intervideosink channel=cam"
-        ).format(video_pattern, frame_pattern)
+        ).format(video_pattern, frame_pattern) + hls_branches
         
         print(f"🔧 파이프라인 생성: {pipeline_str}")
         return Gst.parse_launch(pipeline_str)
 
+    def _attach_record_pipeline(self):
+        """버스 콜백과 버퍼 흐름 감시 프로브 연결"""
+        bus = self.record_pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", frame_file_created_callback, self.on_frame_ready)
+        bus.connect("message::element", self._on_element_message)
+        bus.connect("message::error", self._on_pipeline_error)
+        bus.connect("message::eos", self._on_pipeline_eos)
+
+        tee_sink = self.record_pipeline.get_by_name("t").get_static_pad("sink")
+        tee_sink.add_probe(Gst.PadProbeType.BUFFER, self._on_buffer_probe)
+        # 원본 프레임은 흐르는데 인코더/먹서가 멈춘 경우도 감지
+        enc_src = self.record_pipeline.get_by_name("enc").get_static_pad("src")
+        enc_src.add_probe(Gst.PadProbeType.BUFFER, self._on_encoded_buffer_probe)
+
+    def _on_buffer_probe(self, pad, info):
+        # 스트리밍 스레드에서 호출되므로 시각만 기록
+        self.last_buffer_time = time.monotonic()
+        return Gst.PadProbeReturn.OK
+
+    def _on_encoded_buffer_probe(self, pad, info):
+        self.last_encoded_time = time.monotonic()
+        self.encoded_seen = True
+        return Gst.PadProbeReturn.OK
+
+    def _on_pipeline_error(self, bus, message):
+        err, debug = message.parse_error()
+        EVENTS.error("pipeline_error", f"❌ 녹화 파이프라인 오류: {err}", debug=debug)
+        self._recover("오류")
+
+    def _on_pipeline_eos(self, bus, message):
+        if not self.recovering:
+            EVENTS.warning("pipeline_eos", "⚠️ 녹화 파이프라인 EOS 수신")
+            self._recover("EOS")
+
+    def _watchdog_tick(self):
+        if self.encoded_seen and not self.pipeline_confirmed:
+            self.pipeline_confirmed = True
+            self.good_config = self._control_config()
+        now = time.monotonic()
+        for branch, last_time in (("원본", self.last_buffer_time), ("인코딩", self.last_encoded_time)):
+            stalled = now - last_time
+            if not self.recovering and not self.rebuild_source and stalled > STALL_TIMEOUT_SEC:
+                EVENTS.warning(
+                    "pipeline_stalled",
+                    f"⚠️ 녹화 파이프라인 정지 감지 ({branch} 버퍼 {stalled:.1f}초 동안 없음)",
+                    branch=branch,
+                    stalled_sec=round(stalled, 1),
+                )
+                self._recover("정지")
+        return True
+
+    def _reset_stall_timers(self):
+        self.last_buffer_time = self.last_encoded_time = time.monotonic()
+
+    def _recover(self, reason):
+        """
+        녹화 파이프라인만 재시작합니다. RTSP 서버와 클라이언트는 intervideosrc 로
+        분리되어 있어 연결이 유지됩니다. 재시작 전 현재 세그먼트에 EOS 를 보내
+        마무리하고, fragment-closed 또는 제한 시간 후 새 파이프라인을 만듭니다.
+        """
+        if self.recovering or self.rebuild_source:
+            return
+        EVENTS.warning("pipeline_recovering", f"🔄 녹화 파이프라인 복구 시작 ({reason})", reason=reason)
+        self._revert_unconfirmed_config()
+        if self.current_segment:
+            self.unaligned_segments.add(self.current_segment)
+        self._finalize_and_rebuild()
+
+    def _finalize_and_rebuild(self):
+        self.recovering = True
+        delay = RECOVERY_RETRY_SEC
+        if self.current_segment:
+            smux = self.record_pipeline.get_by_name("smux")
+            pad = smux.get_static_pad("video") if smux else None
+            if pad and pad.send_event(Gst.Event.new_eos()):
+                delay = FINALIZE_TIMEOUT_SEC
+        self.rebuild_source = GLib.timeout_add(int(delay * 1000), self._rebuild_record_pipeline)
+
+    def _rebuild_record_pipeline(self):
+        self.rebuild_source = None
+        # 새 파이프라인이 대기 중인 설정을 함께 반영하므로 예약된 재구성은 취소
+        if self.restart_source:
+            GLib.source_remove(self.restart_source)
+            self.restart_source = None
+
+        # 새 파이프라인을 먼저 만들어, 실패하면 기존 파이프라인을 그대로 두고 재시도
+        try:
+            new_pipeline = self._create_record_pipeline()
+        except Exception as e:
+            self._retry_rebuild(e)
+            return False
+
+        old_pipeline = self.record_pipeline
+        old_pipeline.get_bus().remove_signal_watch()
+        old_pipeline.set_state(Gst.State.NULL)
+        if self.current_segment:
+            EVENTS.warning("segment_unfinalized", f"⚠️ 마무리되지 않은 세그먼트: {self.current_segment}", location=self.current_segment)
+            self.current_segment = None
+
+        self.record_pipeline = new_pipeline
+        self.pipeline_confirmed = self.encoded_seen = False
+        try:
+            self._attach_record_pipeline()
+            self._reset_stall_timers()
+            self.recovering = False
+            self.record_pipeline.set_state(Gst.State.PLAYING)
+        except Exception as e:
+            self._retry_rebuild(e)
+            return False
+        EVENTS.info("pipeline_recovered", "✅ 녹화 파이프라인 재시작 완료")
+
+        # 재구성으로 해상도가 바뀌었을 수 있으므로 HLS master 갱신
+        self._write_hls_master()
+        if self.segment_seconds == SEGMENT_SECONDS:
+            self._schedule_realign()
+        return False
+
+    def _retry_rebuild(self, error):
+        """재구성 중 예외: 감시가 멈추지 않도록 상태를 되돌리고 잠시 후 다시 시도"""
+        EVENTS.error("pipeline_rebuild_failed", f"❌ 녹화 파이프라인 재생성 실패, {RECOVERY_RETRY_SEC}초 후 재시도: {error}")
+        self._revert_unconfirmed_config()
+        self.recovering = False
+        self._reset_stall_timers()
+        self.rebuild_source = GLib.timeout_add(int(RECOVERY_RETRY_SEC * 1000), self._rebuild_record_pipeline)
+
+    def _revert_unconfirmed_config(self):
+        """새 설정으로 만든 파이프라인이 한 번도 인코딩하지 못했으면 마지막 정상 설정으로 되돌림"""
+        if self.pipeline_confirmed or not self.good_config:
+            return
+        current = self._control_config()
+        reverted = {name: value for name, value in self.good_config.items() if current[name] != value}
+        if not reverted:
+            return
+        EVENTS.error(
+            "config_reverted",
+            "↩️ 새 설정으로 녹화 실패, 마지막 정상 설정으로 복귀",
+            failed={name: current[name] for name in reverted},
+            reverted=reverted,
+        )
+        for name, value in reverted.items():
+            setattr(self, name, value)
+        if "encoder_options" in reverted:
+            self.factory.update_encoder(self.encoder_options, parse_options(self.encoder_options))
+        self._write_hls_master()
+
+    def _validate_encoder_options(self, options):
+        """
+        인코더 옵션 값을 실제로 파싱해 확인합니다.
+        (Gst.util_set_object_arg 는 해석할 수 없는 값을 조용히 무시하므로 미리 검증)
+        """
+        element = Gst.ElementFactory.make(self.encoder, None)
+        if element is None:
+            raise ValueError(f"인코더 없음: {self.encoder}")
+        for name, value in parse_options(options).items():
+            pspec = element.find_property(name)
+            if pspec is None:
+                raise ValueError(f"인코더 속성 없음: {name}")
+            gvalue = GObject.Value()
+            gvalue.init(pspec.value_type)
+            if not Gst.value_deserialize(gvalue, value):
+                raise ValueError(f"잘못된 인코더 값: {name}={value}")
+        # 새 RTSP 미디어와 파이프라인 재생성에 그대로 쓰이는 문자열이므로 한 번 더 확인
+        try:
+            Gst.parse_launch(f"{self.encoder} {options}")
+        except GLib.Error as e:
+            raise ValueError(f"인코더 옵션 오류: {e.message}")
+
+    def _camera_supports(self, width, height):
+        """v4l2src 가 보고하는 캡스로 해상도 지원 여부 확인 (장치를 열 수 없으면 None)"""
+        src = Gst.ElementFactory.make("v4l2src", None)
+        if src is None:
+            return None
+        src.set_property("device", self.device)
+        try:
+            if src.set_state(Gst.State.READY) == Gst.StateChangeReturn.FAILURE:
+                return None
+            caps = src.get_static_pad("src").query_caps(None)
+        finally:
+            src.set_state(Gst.State.NULL)
+        wanted = Gst.Caps.from_string(f"video/x-raw,format=NV12,width={width},height={height}")
+        return caps.can_intersect(wanted)
+
+    def _schedule_realign(self):
+        """다음 1분 경계에서 세그먼트를 나눠 정시 정렬 복구"""
+        if self.realign_source:
+            GLib.source_remove(self.realign_source)
+        self.realign_pending = True
+        now = datetime.now(timezone(timedelta(hours=9)))
+        next_minute = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        self.realign_source = GLib.timeout_add(
+            int((next_minute - now).total_seconds() * 1000), self._realign_segment
+        )
+
+    def _realign_segment(self):
+        self.realign_source = None
+        smux = self.record_pipeline.get_by_name("smux")
+        if smux and not self.recovering and self.segment_seconds == SEGMENT_SECONDS:
+            smux.emit("split-now")
+            EVENTS.info("segment_realigned", "⏰ 1분 경계 세그먼트 분할 (정시 정렬)")
+        self.realign_pending = False
+        return False
+
+    def _write_hls_master(self):
+        if not self.hls_dir:
+            return
+        try:
+            write_master_playlist(self.hls_dir, self.encoder_options, (self.width, self.height), self.hls_h264_variant)
+        except OSError as e:
+            EVENTS.warning("hls_master_failed", f"⚠️ HLS master.m3u8 갱신 실패: {e}")
+
     @with_file_lock
     def _on_element_message(self, bus, message):
         structure = message.get_structure()
         if not structure:
             return
-        if structure.get_name() == "splitmuxsink-fragment-closed":
+        if structure.get_name() == "splitmuxsink-fragment-opened":
             location = structure.get_string("location")
+            if location:
+                self.segment_open_times[location] = time.time()
+                self.current_segment = location
+                self.segment_count += 1
+                if self.realign_pending:
+                    self.unaligned_segments.add(location)
+        elif structure.get_name() == "splitmuxsink-fragment-closed":
+            location = structure.get_string("location")
+            if location == self.current_segment:
+                self.current_segment = None
+                # 복구 중이면 마무리 완료 즉시 재시작
+                if self.recovering and self.rebuild_source:
+                    GLib.source_remove(self.rebuild_source)
+                    self.rebuild_source = GLib.idle_add(self._rebuild_record_pipeline)
             if location and os.path.exists(location):
                 try:
                     # 현재 정확한 KST 시간 확인
@@ -307,52 +779,211 @@ class RtspRecordingService:
                     # 정확한 리네이밍을 위해 1분 전 시간 기준으로 타임스탬프 설정
                     adjusted_time = now - timedelta(minutes=1)
                     aligned_time = adjusted_time.replace(second=0, microsecond=0)
+                    unaligned = location in self.unaligned_segments or self.segment_seconds != SEGMENT_SECONDS
+                    self.unaligned_segments.discard(location)
+                    if unaligned:
+                        # 복구로 잘린 세그먼트는 실제 시작 시각으로 이름을 지어 덮어쓰기 방지
+                        opened = self.segment_open_times.get(location, aligned_time.timestamp())
+                        aligned_time = datetime.fromtimestamp(int(opened), timezone(timedelta(hours=9)))
                     timestamp = aligned_time.strftime("%Y%m%d_%H%M%S")
 
-                    print(f"🕒 현재 시간: {now.strftime('%H:%M:%S.%f')}, 리네이밍 기준 타임스탬프: {timestamp}")
+                    EVENTS.debug("segment_timestamp", f"🕒 현재 시간: {now.strftime('%H:%M:%S.%f')}, 리네이밍 기준 타임스탬프: {timestamp}")
 
                     new_video_path = os.path.join(
-                        self.record_path, f"{DEVICE_SN}_{timestamp}.mp4"
+                        self.record_path, f"{load_sn()}_{timestamp}.mp4"
                     )
 
                     # 파일 이름 변경 전 완전히 쓰여졌는지 확인
                     file_size = os.path.getsize(location)
                     if file_size == 0:
-                        print(f"⚠️ 빈 파일 감지: {location}, 건너뜀")
+                        EVENTS.warning("segment_empty", f"⚠️ 빈 파일 감지: {location}, 건너뜀", location=location)
                         os.remove(location)
                         return
 
                     if os.path.exists(new_video_path):
                         os.remove(new_video_path)
-                        print(f"⚠️ 기존 파일 삭제: {new_video_path}")
+                        EVENTS.warning("segment_overwritten", f"⚠️ 기존 파일 삭제: {new_video_path}", path=new_video_path)
 
                     os.rename(location, new_video_path)
                     with open(self.upload_info_file, "a") as f:
                         f.write(f"{new_video_path}|{timestamp}|{int(time.time())}\n")
 
-                    print(f"✅ 비디오 리네이밍: {location} → {new_video_path}")
+                    EVENTS.info("segment_closed", f"✅ 비디오 리네이밍: {location} → {new_video_path}", path=new_video_path, size=file_size)
+
+                    # 로컬 세그먼트 인덱스 갱신
+                    start_time = self.segment_open_times.pop(
+                        location, aligned_time.timestamp()
+                    )
+                    self.segment_index.add(new_video_path, start_time)
+
+                    if self.on_segment_ready:
+                        self.on_segment_ready(new_video_path)
                 except Exception as e:
-                    print(f"❌ 파일 변경 실패: {e}")
+                    EVENTS.error("segment_rename_failed", f"❌ 파일 변경 실패: {e}")
+
+    def _control_config(self):
+        return {
+            "encoder_options": self.encoder_options,
+            "frame_rate": self.frame_rate,
+            "segment_seconds": self.segment_seconds,
+            "width": self.width,
+            "height": self.height,
+            "framerate": self.framerate,
+        }
+
+    def _handle_control(self, request):
+        """
+        설정 변경 요청 처리 (메인 루프)
+        - encoder_options, frame_rate, segment_seconds: 실행 중인 파이프라인에 바로 적용
+        - width, height, framerate: 다음 세그먼트 경계에서 녹화 파이프라인을 다시 만들어 적용
+        """
+        unknown = set(request) - set(self._control_config())
+        if unknown:
+            return {"ok": False, "error": f"알 수 없는 설정: {', '.join(sorted(unknown))}"}
+
+        # 적용 전에 모두 검증해 일부만 바뀌는 일이 없도록 함
+        try:
+            encoder_changes = parse_options(request.get("encoder_options", ""))
+            if encoder_changes:
+                options = parse_options(self.encoder_options)
+                options.update(encoder_changes)
+                encoder_options = format_options(options)
+                self._validate_encoder_options(encoder_options)
+            frame_rate = parse_frame_rate(request["frame_rate"]) if "frame_rate" in request else None
+            segment_seconds = parse_positive_int(request["segment_seconds"]) if "segment_seconds" in request else None
+            caps = {
+                "width": parse_positive_int(request.get("width", self.width)),
+                "height": parse_positive_int(request.get("height", self.height)),
+                "framerate": parse_fraction(request.get("framerate", self.framerate)),
+            }
+        except (ValueError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+        if (caps["width"], caps["height"]) != (self.width, self.height):
+            if self._camera_supports(caps["width"], caps["height"]) is False:
+                return {"ok": False, "error": f"카메라가 지원하지 않는 해상도: {caps['width']}x{caps['height']}"}
+
+        applied = {}
+        if encoder_changes:
+            enc = self.record_pipeline.get_by_name("enc")
+            if enc:
+                for name, value in encoder_changes.items():
+                    Gst.util_set_object_arg(enc, name, value)
+            self.encoder_options = encoder_options
+            self.factory.update_encoder(self.encoder_options, encoder_changes)
+            self._write_hls_master()
+            applied["encoder_options"] = self.encoder_options
+
+        if frame_rate:
+            self.frame_rate = frame_rate
+            self.record_pipeline.get_by_name("frame_caps").set_property(
+                "caps", Gst.Caps.from_string(f"video/x-raw,framerate={self.frame_rate}")
+            )
+            applied["frame_rate"] = self.frame_rate
+
+        if segment_seconds and segment_seconds != self.segment_seconds:
+            self.segment_seconds = segment_seconds
+            self.record_pipeline.get_by_name("smux").set_property(
+                "max-size-time", self.segment_seconds * Gst.SECOND
+            )
+            # 길이가 바뀐 세그먼트는 1분 경계와 맞지 않으므로 실제 시작 시각으로 이름 지정
+            # (1분 규칙으로 이름을 지으면 이전 세그먼트와 겹쳐 덮어쓰게 됨)
+            if self.current_segment:
+                self.unaligned_segments.add(self.current_segment)
+            if self.segment_seconds == SEGMENT_SECONDS:
+                self._schedule_realign()
+            applied["segment_seconds"] = self.segment_seconds
+
+        # 제자리 적용된 값은 재구성 실패 시 되돌릴 정상 설정에도 반영
+        if self.good_config and self.pipeline_confirmed:
+            self.good_config.update(applied)
+
+        pending = {}
+        for name, value in caps.items():
+            if value != getattr(self, name):
+                setattr(self, name, value)
+                pending[name] = value
+        if pending:
+            self._schedule_reconfigure()
+
+        if applied or pending:
+            EVENTS.info("config_changed", "🎛️ 설정 변경", applied=applied, pending=pending)
+        return {"ok": True, "applied": applied, "pending": pending, "config": self._control_config()}
+
+    def _schedule_reconfigure(self):
+        """현재 세그먼트가 끝나는 시각에 녹화 파이프라인을 다시 만들도록 예약"""
+        if self.restart_source or self.recovering:
+            return
+        now = time.time()
+        if self.segment_seconds == SEGMENT_SECONDS:
+            boundary = (int(now) // 60 + 1) * 60
+        else:
+            opened = self.segment_open_times.get(self.current_segment, now)
+            boundary = max(opened + self.segment_seconds, now)
+        self.restart_source = GLib.timeout_add(int((boundary - now) * 1000), self._reconfigure_record_pipeline)
+
+    def _reconfigure_record_pipeline(self):
+        self.restart_source = None
+        if self.recovering:
+            return False
+        EVENTS.info("pipeline_reconfiguring", "🔧 세그먼트 경계에서 녹화 파이프라인 재구성")
+        if self.current_segment:
+            # 경계 직전에 자동 분할된 짧은 세그먼트는 실제 시작 시각으로 이름 지정
+            opened = self.segment_open_times.get(self.current_segment, 0)
+            if time.time() - opened < self.segment_seconds / 2:
+                self.unaligned_segments.add(self.current_segment)
+        self._finalize_and_rebuild()
+        return False
 
     def start(self):
         if self.server.attach(None) == 0:
             print("❌ RTSP 서버 연결 실패")
             sys.exit(1)
         print("✅ RTSP 서버 연결 성공")
+        if self.clip_server:
+            self.clip_server.start()
+        if self.live_server:
+            self.live_server.start()
+        self.client_monitor.start()
+        if self.control_server:
+            self.control_server.start()
         self.record_pipeline.set_state(Gst.State.PLAYING)
         print("✅ 녹화 파이프라인 시작")
+        self._reset_stall_timers()
+        self.watchdog_source = GLib.timeout_add_seconds(1, self._watchdog_tick)
 
     def run(self):
         self.start()
         try:
             self.loop.run()
         except Exception as e:
-            print(f"❌ 메인 루프 오류: {e}")
+            EVENTS.error("main_loop_error", f"❌ 메인 루프 오류: {e}")
         finally:
             self.stop()
 
     def stop(self):
+        if self.watchdog_source:
+            GLib.source_remove(self.watchdog_source)
+            self.watchdog_source = None
+        if self.rebuild_source:
+            GLib.source_remove(self.rebuild_source)
+            self.rebuild_source = None
+        if self.restart_source:
+            GLib.source_remove(self.restart_source)
+            self.restart_source = None
+        if self.realign_source:
+            GLib.source_remove(self.realign_source)
+            self.realign_source = None
+        if self.control_server:
+            self.control_server.stop()
+            self.control_server = None
         self.record_pipeline.set_state(Gst.State.NULL)
+        self.client_monitor.stop()
+        if self.clip_server:
+            self.clip_server.stop()
+            self.clip_server = None
+        if self.live_server:
+            self.live_server.stop()
+            self.live_server = None
         if self.loop.is_running():
             self.loop.quit()
         print("✅ 서비스 정상 종료")
@@ -364,7 +995,7 @@ def signal_handler(sig, frame, service):
     sys.exit(0)
 
 
-def parse_args():
+def build_arg_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--device", default="/dev/video0")
     parser.add_argument("--port", type=int, default=8554)
@@ -375,45 +1006,61 @@ def parse_args():
     parser.add_argument("--pt", type=int, default=97)
     parser.add_argument("--record-path", default="/home/radxa/Videos")
     parser.add_argument("--frame-path", default="/home/radxa/Frames")
-    return parser.parse_args()
+    parser.add_argument("--clip-port", type=int, default=8555)
+    parser.add_argument("--clip-host", default="127.0.0.1", help="클립 서버 바인딩 주소 (LAN 공개 시 0.0.0.0 + --clip-token 권장)")
+    parser.add_argument("--clip-token", default=os.environ.get("CLIP_TOKEN", ""), help="클립 서버 접근 토큰 (빈 값이면 인증 없음)")
+    parser.add_argument("--log-level", choices=list(LEVELS), default="INFO")
+    parser.add_argument("--rtsp-protocols", type=protocols_arg, default="udp,udp-mcast,tcp")
+    parser.add_argument("--multicast-range", default="224.3.0.1-224.3.0.10")
+    parser.add_argument("--multicast-ports", default="5000-5100")
+    parser.add_argument("--multicast-ttl", type=int, default=16)
+    parser.add_argument("--tcp-send-buffer", type=int, default=0, help="RTSP 클라이언트 소켓 SO_SNDBUF (바이트, 0 이면 기본값)")
+    parser.add_argument("--max-clients", type=int, default=0, help="최대 동시 RTSP 클라이언트 수 (0 이면 제한 없음)")
+    parser.add_argument("--rtsp-backlog", type=int, default=2)
+    parser.add_argument("--hls-dir", default="", help="HLS 출력 폴더 (예: /dev/shm/hls, 빈 값이면 비활성화)")
+    parser.add_argument("--hls-target-duration", type=int, default=1)
+    parser.add_argument("--hls-playlist-length", type=int, default=6)
+    parser.add_argument("--hls-h264", action="store_true", help="H.264 렌디션 추가 (HEVC 미지원 브라우저용)")
+    parser.add_argument("--hls-h264-encoder", default="mpph264enc")
+    parser.add_argument("--hls-h264-options", default="bps=4000000 rc-mode=cbr")
+    parser.add_argument("--hls-h264-width", type=int, default=1280)
+    parser.add_argument("--hls-h264-height", type=int, default=720)
+    parser.add_argument("--hls-port", type=int, default=8556, help="HLS 라이브 서버 포트 (0 이면 HLS 비활성화)")
+    parser.add_argument("--hls-host", default="0.0.0.0", help="HLS 라이브 서버 바인딩 주소")
+    parser.add_argument("--hls-token", default=os.environ.get("HLS_TOKEN", ""), help="HLS 경로 토큰 (/live/<token>/master.m3u8)")
+    parser.add_argument("--width", type=_arg_type(parse_positive_int), default=1280, help="카메라 해상도 (가로)")
+    parser.add_argument("--height", type=_arg_type(parse_positive_int), default=720, help="카메라 해상도 (세로)")
+    parser.add_argument("--framerate", type=_arg_type(parse_fraction), default="30/1", help="카메라 프레임레이트")
+    parser.add_argument("--frame-rate", type=_arg_type(parse_frame_rate), default="1/1", help="JPEG 프레임 저장 주기 (1/1 이하)")
+    parser.add_argument("--segment-seconds", type=_arg_type(parse_positive_int), default=SEGMENT_SECONDS)
+    parser.add_argument("--control-socket", default="/tmp/rtsp_control.sock", help="설정 변경 API 소켓 (빈 값이면 비활성화)")
+    return parser
 
 
-def main():
-    global DEVICE_SN
+def parse_args():
+    return build_arg_parser().parse_args()
+
 
+def main():
     ip = get_local_ip()
     if not ip:
         print("❌ 로컬 IP 주소 확인 실패")
         sys.exit(1)
     print(f"✅ 로컬 IP 주소: {ip}")
 
-    sn = load_sn()
-    if sn and sn != "UNKNOWN":
-        print(f"✅ 기존 SN 확인: {sn}")
-        update_device(sn, ip)
-        DEVICE_SN = sn
-    else:
-        print("ℹ️ SN 없음, 새로 등록 시도")
-        result = register_device(ip)
-        if result:
-            new_sn = result.get("serial_number")
-            if new_sn:
-                save_sn(new_sn)
-                DEVICE_SN = new_sn
-                print(f"✅ 새 SN 등록 완료: {new_sn}")
-            else:
-                print("❌ SN 응답 없음")
-                sys.exit(1)
-        else:
-            print("❌ 디바이스 등록 실패")
-            sys.exit(1)
-
-    if DEVICE_SN == "UNKNOWN":
+    sn = register_or_update_device(ip)
+    if not sn or sn == "UNKNOWN":
         print("❌ 유효한 SN 없음")
         sys.exit(1)
 
-    print(f"🚀 RTSP 서버 시작 (SN: {DEVICE_SN})")
+    monitor = NetworkMonitor()
+    monitor.add_listener(reregister_device)
+    monitor.start()
+
+    print(f"🚀 RTSP 서버 시작 (SN: {sn})")
     args = parse_args()
+    EVENTS.configure(service="rtsp_server", level=LEVELS[args.log_level])
+    EVENTS.install_dump_signal()
     service = RtspRecordingService(
         device=args.device,
         port=args.port,
@@ -424,6 +1071,33 @@ def main():
         pt=args.pt,
         record_path=args.record_path,
         frame_path=args.frame_path,
+        clip_port=args.clip_port,
+        clip_host=args.clip_host,
+        clip_token=args.clip_token or None,
+        rtsp_protocols=args.rtsp_protocols,
+        multicast_range=args.multicast_range,
+        multicast_ports=args.multicast_ports,
+        multicast_ttl=args.multicast_ttl,
+        tcp_send_buffer=args.tcp_send_buffer,
+        max_clients=args.max_clients,
+        rtsp_backlog=args.rtsp_backlog,
+        hls_dir=args.hls_dir,
+        hls_target_duration=args.hls_target_duration,
+        hls_playlist_length=args.hls_playlist_length,
+        hls_h264=args.hls_h264,
+        hls_h264_encoder=args.hls_h264_encoder,
+        hls_h264_options=args.hls_h264_options,
+        hls_h264_width=args.hls_h264_width,
+        hls_h264_height=args.hls_h264_height,
+        hls_port=args.hls_port,
+        hls_host=args.hls_host,
+        hls_token=args.hls_token or None,
+        width=args.width,
+        height=args.height,
+        framerate=args.framerate,
+        frame_rate=args.frame_rate,
+        segment_seconds=args.segment_seconds,
+        control_socket=args.control_socket,
     )
     signal.signal(signal.SIGINT, lambda s, f: signal_handler(s, f, service))
     signal.signal(signal.SIGTERM, lambda s, f: signal_handler(s, f, service))
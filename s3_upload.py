@@ -1,13 +1,22 @@
 import os
 import time
-import cv2
 import shutil
 import requests
 import fcntl
+import json
+import base64
+import hashlib
 from datetime import datetime, timezone, timedelta
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import logging
+import argparse
+
+from device_identity import DeviceIdentity
+from event_log import EVENTS, LEVELS
+from net_monitor import NetworkMonitor, has_default_route
+from frame_preprocess import FramePreprocessor, parse_roi
+from frame_analytics import FrameAnalyzer
 
 # 로깅 설정
 logging.basicConfig(
@@ -21,11 +30,36 @@ RECORD_PATH = "/home/radxa/Videos"
 FRAME_PATH = "/home/radxa/Frames"
 API_BASE_URL = "https://api.saffir.co.kr"
 LOCK_FILE = "/home/radxa/upload_lock.lock"  # 업로드 동기화용 잠금 파일
+TRACKER_LOCK_FILE = "/home/radxa/video_processing.lock"  # rtsp_server.py 와 공유 (트래커 동시 수정 방지)
 UPLOAD_TRACKER = "/home/radxa/Videos/.upload_tracker"  # 업로드 상태 추적 파일
+UPLOAD_STATE = "/home/radxa/Videos/.upload_state"  # 영상별 체크섬 및 업로드 진행 상태
+
+# 업로드 완료 영상의 로컬 보관 (클립 서버의 /segments, /clip 조회용)
+# 기간이나 용량 중 먼저 넘는 쪽부터 오래된 영상을 삭제, 0 이면 업로드 직후 삭제
+LOCAL_RETENTION_SEC = 30 * 60
+LOCAL_RETENTION_BYTES = 2048 * 1024 * 1024
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
 
 # 이미지와 영상 업로드용 스레드 풀 각각 생성
 image_upload_executor = ThreadPoolExecutor(max_workers=2)
 video_upload_executor = ThreadPoolExecutor(max_workers=2)  # 영상 업로드용 스레드 풀
+preprocess_executor = ThreadPoolExecutor(max_workers=2)  # 프레임 전처리용 스레드 풀
+# 분석은 이전 프레임과 비교(activity)하므로 배치 순서가 유지되도록 단일 스레드
+analytics_executor = ThreadPoolExecutor(max_workers=1)
+
+# 프레임 전처리 (configure_preprocess 로 설정, None 이면 원본 그대로 업로드)
+FRAME_PREPROCESSOR = None
+PREPROCESS_BATCH_SIZE = 4  # 한 번에 전처리할 프레임 수
+PREPROCESS_MAX_WAIT_SEC = 2  # 배치가 다 차지 않아도 이 시간이 지나면 처리
+pending_frames = []
+pending_frames_since = 0
+pending_frames_lock = threading.Lock()
+
+# 온디바이스 분석 (configure_analytics 로 설정, None 이면 모든 프레임 업로드)
+FRAME_ANALYZER = None
+METADATA_BATCH_SIZE = 60  # 프레임 메타데이터를 이 개수만큼 모아 JSON 한 파일로 업로드
+metadata_results = []
+metadata_lock = threading.Lock()
 
 # 이미 처리한 파일을 추적하기 위한 세트
 processed_files = set()
@@ -35,6 +69,26 @@ processed_videos = set()
 failed_uploads = {}
 MAX_RETRY = 3  # 최대 재시도 횟수
 
+# 업로드 상태 파일 접근 동기화 (영상 업로드 스레드 간)
+upload_state_lock = threading.Lock()
+
+# 기본 경로가 있을 때만 set, 업로드 작업은 연결이 돌아올 때까지 대기
+network_available = threading.Event()
+if has_default_route():
+    network_available.set()
+
+
+def on_network_change(ip, online):
+    """네트워크 모니터 리스너: 연결 상태에 따라 업로드 일시정지/재개"""
+    if online:
+        if not network_available.is_set():
+            EVENTS.info("network_up", f"🌐 네트워크 연결 복구 (IP: {ip}), 업로드 재개")
+        network_available.set()
+    else:
+        if network_available.is_set():
+            EVENTS.warning("network_down", "⚠️ 기본 경로 없음, 업로드 일시정지")
+        network_available.clear()
+
 # 파일 잠금을 통한 동기화 헬퍼 함수
 def with_file_lock(func):
     def wrapper(*args, **kwargs):
@@ -48,50 +102,232 @@ def with_file_lock(func):
     return wrapper
 
 
+# sn.txt 는 mtime 이 바뀔 때만 다시 읽음
+DEVICE_IDENTITY = DeviceIdentity(["sn.txt", "/home/radxa/sn.txt"])
+
+
 def load_sn():
-    try:
-        if os.path.exists("sn.txt"):
-            with open("sn.txt", "r") as f:
-                return f.read().strip()
-        elif os.path.exists("/home/radxa/sn.txt"):
-            with open("/home/radxa/sn.txt", "r") as f:
-                return f.read().strip()
-        else:
-            logger.error("❌ SN 파일을 찾을 수 없음")
-            return "UNKNOWN"
-    except Exception as e:
-        logger.error(f"❌ SN 로드 실패: {e}")
-        return "UNKNOWN"
+    sn = DEVICE_IDENTITY.sn
+    if sn == "UNKNOWN":
+        EVENTS.error("sn_missing", "❌ SN 파일을 찾을 수 없음")
+    return sn
+
+
+def configure(record_path=None, frame_path=None, api_base_url=None):
+    """통합 에이전트에서 공용 설정으로 경로/서버 주소를 덮어씁니다."""
+    global RECORD_PATH, FRAME_PATH, API_BASE_URL, UPLOAD_TRACKER, UPLOAD_STATE
+    if record_path:
+        RECORD_PATH = record_path
+        UPLOAD_TRACKER = os.path.join(record_path, ".upload_tracker")
+        UPLOAD_STATE = os.path.join(record_path, ".upload_state")
+    if frame_path:
+        FRAME_PATH = frame_path
+    if api_base_url:
+        API_BASE_URL = api_base_url
+
+
+def add_preprocess_args(parser):
+    parser.add_argument("--roi", type=parse_roi, action="append", default=[],
+                        help="프레임에서 잘라낼 영역 x,y,w,h (여러 번 지정 가능)")
+    parser.add_argument("--frame-max-width", type=int)
+    parser.add_argument("--frame-max-height", type=int)
+    parser.add_argument("--frame-quality", type=int)
+
+
+def configure_preprocess(args):
+    """전처리 옵션이 하나라도 지정되면 프레임 전처리를 활성화합니다."""
+    global FRAME_PREPROCESSOR
+    if not (args.roi or args.frame_max_width or args.frame_max_height or args.frame_quality):
+        FRAME_PREPROCESSOR = None
+        return
+    FRAME_PREPROCESSOR = FramePreprocessor(
+        rois=args.roi,
+        max_width=args.frame_max_width,
+        max_height=args.frame_max_height,
+        quality=args.frame_quality or 80,
+    )
+    logger.info(
+        f"✂️ 프레임 전처리 활성화: ROI {args.roi or '전체'}, "
+        f"최대 {args.frame_max_width or '-'}x{args.frame_max_height or '-'}, 품질 {FRAME_PREPROCESSOR.quality}"
+    )
+
+
+def add_retention_args(parser):
+    parser.add_argument("--keep-uploaded-minutes", type=float, default=LOCAL_RETENTION_SEC / 60,
+                        help="업로드 완료 영상을 로컬에 보관할 시간 (0 이면 업로드 직후 삭제)")
+    parser.add_argument("--keep-uploaded-mb", type=int, default=LOCAL_RETENTION_BYTES // (1024 * 1024),
+                        help="업로드 완료 영상의 최대 로컬 보관 용량")
+
+
+def configure_retention(args):
+    global LOCAL_RETENTION_SEC, LOCAL_RETENTION_BYTES
+    LOCAL_RETENTION_SEC = args.keep_uploaded_minutes * 60
+    LOCAL_RETENTION_BYTES = args.keep_uploaded_mb * 1024 * 1024
+    logger.info(f"🗄️ 업로드 완료 영상 보관: {args.keep_uploaded_minutes:g}분 / {args.keep_uploaded_mb}MB")
+
+
+def add_analytics_args(parser):
+    parser.add_argument("--analytics-model", help="OpenCV DNN 모델 파일 (SSD 출력 형식)")
+    parser.add_argument("--analytics-config", help="모델 설정 파일 (prototxt/pbtxt 등)")
+    parser.add_argument("--analytics-input-size", type=int, default=300)
+    parser.add_argument("--analytics-confidence", type=float, default=0.5)
+    parser.add_argument("--analytics-activity-threshold", type=float, default=0.02)
+    parser.add_argument("--full-frame-interval", type=int, default=10,
+                        help="검출이 없어도 N 프레임마다 원본 JPEG 업로드 (0 이면 비활성화)")
+
+
+def configure_analytics(args):
+    """모델이 지정되면 온디바이스 분석을 활성화합니다."""
+    global FRAME_ANALYZER
+    if not args.analytics_model:
+        FRAME_ANALYZER = None
+        return
+    FRAME_ANALYZER = FrameAnalyzer(
+        args.analytics_model,
+        args.analytics_config,
+        input_size=args.analytics_input_size,
+        confidence=args.analytics_confidence,
+        activity_threshold=args.analytics_activity_threshold,
+        full_frame_interval=args.full_frame_interval,
+    )
+    logger.info(f"🧠 온디바이스 분석 활성화: {os.path.basename(args.analytics_model)}")
 
 
 def get_presigned_opencv_url(sn, filename):
     try:
-        logger.info(f"📡 jpg URL 요청 중: {filename}")
+        EVENTS.debug("url_request", f"📡 jpg URL 요청 중: {filename}")
         url = f"{API_BASE_URL}/s3/opencv/upload-url"
         payload = {"SN": sn, "filename": filename}
         res = requests.post(url, json=payload, timeout=10)
         res.raise_for_status()
-        logger.info(f"✅ jpg URL 발급 성공: {filename}")
+        EVENTS.debug("url_issued", f"✅ jpg URL 발급 성공: {filename}")
         return res.json().get("upload_url")
     except Exception as e:
-        logger.error(f"❌ jpg URL 요청 실패: {filename} - {e}")
+        EVENTS.error("url_request_failed", f"❌ jpg URL 요청 실패: {filename} - {e}")
         return None
 
 
-def get_presigned_video_url(sn, filename):
+def get_presigned_metadata_url(sn, filename):
+    """프레임 분석 메타데이터(JSON) 전용 업로드 URL (JPEG 용 opencv 경로와 분리)"""
     try:
-        logger.info(f"📡 영상 URL 요청 중: {filename}")
+        EVENTS.debug("url_request", f"📡 메타데이터 URL 요청 중: {filename}")
+        url = f"{API_BASE_URL}/s3/analytics/upload-url"
+        payload = {"SN": sn, "filename": filename, "content_type": "application/json"}
+        res = requests.post(url, json=payload, timeout=10)
+        res.raise_for_status()
+        EVENTS.debug("url_issued", f"✅ 메타데이터 URL 발급 성공: {filename}")
+        return res.json().get("upload_url")
+    except Exception as e:
+        EVENTS.error("url_request_failed", f"❌ 메타데이터 URL 요청 실패: {filename} - {e}")
+        return None
+
+
+def get_presigned_video_url(sn, filename, checksums=None):
+    try:
+        EVENTS.debug("url_request", f"📡 영상 URL 요청 중: {filename}")
         url = f"{API_BASE_URL}/s3/stream/upload-url"
         payload = {"SN": sn, "filename": filename}
+        if checksums:
+            # 서버가 Content-MD5 를 서명에 포함할 수 있도록 함께 전달
+            payload["md5"] = checksums["md5"]
+            payload["sha256"] = checksums["sha256"]
         res = requests.post(url, json=payload, timeout=10)
         res.raise_for_status()
-        logger.info(f"✅ 영상 URL 발급 성공: {filename}")
+        EVENTS.debug("url_issued", f"✅ 영상 URL 발급 성공: {filename}")
         return res.json().get("upload_url")
     except Exception as e:
-        logger.error(f"❌ 영상 URL 요청 실패: {filename} - {e}")
+        EVENTS.error("url_request_failed", f"❌ 영상 URL 요청 실패: {filename} - {e}")
+        return None
+
+
+def get_remote_video_md5(sn, filename):
+    """
+    서버에 이미 업로드된 영상 객체의 MD5 조회, 없거나 확인 불가 시 None
+    ETag 는 SSE-KMS/멀티파트 객체에서는 MD5 가 아니므로 서버가 etag_is_md5 로 알려준 경우만 사용
+    """
+    try:
+        url = f"{API_BASE_URL}/s3/stream/object-info"
+        payload = {"SN": sn, "filename": filename}
+        res = requests.post(url, json=payload, timeout=10)
+        if res.status_code != 200:
+            return None
+        info = res.json()
+        if info.get("md5"):
+            return info["md5"].strip('"')
+        if info.get("etag_is_md5"):
+            return (info.get("etag") or "").strip('"') or None
+        return None
+    except Exception as e:
+        EVENTS.warning("remote_check_failed", f"⚠️ 업로드 여부 확인 실패: {filename} - {e}")
         return None
 
 
+def compute_checksums(file_path):
+    """파일을 한 번만 읽으며 MD5와 SHA-256을 함께 계산합니다."""
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(CHECKSUM_CHUNK_SIZE)
+            if not chunk:
+                break
+            md5.update(chunk)
+            sha256.update(chunk)
+    return {"md5": md5.hexdigest(), "sha256": sha256.hexdigest()}
+
+
+def load_upload_state():
+    try:
+        with open(UPLOAD_STATE, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_upload_state(state):
+    tmp_path = UPLOAD_STATE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, UPLOAD_STATE)
+
+
+def update_upload_state(filename, **fields):
+    """영상 하나의 업로드 상태를 갱신합니다. fields 가 없으면 항목 삭제"""
+    with upload_state_lock:
+        state = load_upload_state()
+        if fields:
+            state.setdefault(filename, {}).update(fields)
+        else:
+            state.pop(filename, None)
+        save_upload_state(state)
+        return state.get(filename)
+
+
+def get_video_checksums(video_path):
+    """
+    업로드 상태에 저장된 체크섬을 재사용하고, 파일이 바뀌었으면 새로 계산합니다.
+    """
+    video_file = os.path.basename(video_path)
+    stat = os.stat(video_path)
+    with upload_state_lock:
+        entry = load_upload_state().get(video_file, {})
+    if entry.get("size") == stat.st_size and entry.get("mtime") == int(stat.st_mtime) and entry.get("md5"):
+        return entry
+
+    checksums = compute_checksums(video_path)
+    return update_upload_state(
+        video_file,
+        size=stat.st_size,
+        mtime=int(stat.st_mtime),
+        status="pending",
+        **checksums,
+    )
+
+
+def md5_base64(md5_hex):
+    return base64.b64encode(bytes.fromhex(md5_hex)).decode()
+
+
 # 파일이 아직 쓰여지고 있는지 확인하는 함수
 def is_file_being_written(file_path, wait_time=1):
     """
@@ -109,7 +345,7 @@ def is_file_being_written(file_path, wait_time=1):
         
         return new_size != file_size  # 크기가 다르면 아직 쓰여지고 있음
     except Exception as e:
-        logger.error(f"파일 쓰기 상태 확인 오류: {e}")
+        EVENTS.error("write_check_failed", f"파일 쓰기 상태 확인 오류: {e}")
         return True  # 오류 발생 시 안전하게 True 반환
 
 
@@ -121,7 +357,10 @@ def remove_from_upload_tracker(file_path):
     if not os.path.exists(UPLOAD_TRACKER):
         return
         
+    # 녹화 서비스가 트래커에 추가하는 중에 덮어쓰지 않도록 같은 잠금 파일 사용
+    lock_file = open(TRACKER_LOCK_FILE, 'a+')
     try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         with open(UPLOAD_TRACKER, 'r') as f:
             lines = f.readlines()
             
@@ -130,104 +369,195 @@ def remove_from_upload_tracker(file_path):
                 if file_path not in line:
                     f.write(line)
     except Exception as e:
-        logger.error(f"업로드 트래커 업데이트 오류: {e}")
+        EVENTS.error("tracker_update_failed", f"업로드 트래커 업데이트 오류: {e}")
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
 
 
-def upload_and_remove_image(image_path):
+def upload_and_remove_image(image_path, content_type="image/jpeg"):
     if not os.path.exists(image_path):
-        logger.error(f"❌ 이미지 파일 없음: {image_path}")
+        EVENTS.error("image_missing", f"❌ 이미지 파일 없음: {image_path}")
         return False
 
+    network_available.wait()
     try:
         image_name = os.path.basename(image_path)
         sn = load_sn()
         if not sn:
-            logger.error(f"❌ SN 로드 실패, 이미지 삭제: {image_name}")
+            EVENTS.error("sn_missing", f"❌ SN 로드 실패, 이미지 삭제: {image_name}")
             if os.path.exists(image_path):
                 os.remove(image_path)
             return False
 
-        presigned_url = get_presigned_opencv_url(sn, image_name)
+        # 메타데이터는 원본 프레임이 이미 삭제되어 다시 만들 수 없으므로 실패해도 남겨두고 재시도
+        is_metadata = content_type == "application/json"
+        if is_metadata:
+            presigned_url = get_presigned_metadata_url(sn, image_name)
+        else:
+            presigned_url = get_presigned_opencv_url(sn, image_name)
         if not presigned_url:
-            logger.error(f"❌ URL 발급 실패, 이미지 삭제: {image_name}")
+            if is_metadata:
+                EVENTS.error("metadata_url_failed", f"❌ URL 발급 실패, 메타데이터 보관 후 재시도: {image_name}")
+                return False
+            EVENTS.error("image_url_failed", f"❌ URL 발급 실패, 이미지 삭제: {image_name}")
             if os.path.exists(image_path):
                 os.remove(image_path)
             return False
 
         with open(image_path, "rb") as f:
-            logger.info(f"📤 이미지 업로드 시작: {image_name}")
-            res = requests.put(
-                presigned_url, data=f, headers={"Content-Type": "image/jpeg"}, timeout=30
-            )
-            if res.status_code == 200:
-                logger.info(f"✅ 이미지 업로드 성공: {image_name}")
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-                    logger.info(f"🗑️ 이미지 삭제 완료: {os.path.basename(image_path)}")
-                return True
-            else:
-                logger.error(f"❌ 이미지 업로드 실패: {image_name}, 상태 코드: {res.status_code}")
-                return False
+            data = f.read()
+        image_md5 = hashlib.md5(data).hexdigest()
+
+        EVENTS.debug("image_upload_start", f"📤 이미지 업로드 시작: {image_name}")
+        res = requests.put(
+            presigned_url,
+            data=data,
+            headers={"Content-Type": content_type, "Content-MD5": md5_base64(image_md5)},
+            timeout=30,
+        )
+        if res.status_code == 200:
+            # 내용 손상은 Content-MD5 로 S3 가 거절(400 BadDigest)하므로 ETag 차이는 경고만
+            # (SSE-KMS 등에서는 ETag 가 MD5 가 아님)
+            etag = res.headers.get("ETag", "").strip('"')
+            if etag and etag != image_md5:
+                EVENTS.debug("image_etag_mismatch", f"ℹ️ ETag 가 MD5 와 다름: {image_name} (로컬 {image_md5}, 서버 {etag})")
+            EVENTS.count("frame_uploaded")
+            if os.path.exists(image_path):
+                os.remove(image_path)
+                EVENTS.debug("image_removed", f"🗑️ 이미지 삭제 완료: {os.path.basename(image_path)}")
+            return True
+        else:
+            EVENTS.error("image_upload_failed", f"❌ 이미지 업로드 실패: {image_name}, 상태 코드: {res.status_code}")
+            return False
     except Exception as e:
-        logger.error(f"❌ 이미지 업로드 오류: {image_path} - {e}")
+        EVENTS.error("image_upload_error", f"❌ 이미지 업로드 오류: {image_path} - {e}")
         return False
 
 
+def finish_video_upload(video_path):
+    """
+    업로드 완료된 영상을 트래커에서 제거하고 uploaded 로 표시합니다.
+    파일은 보관 기간/용량 안에서 로컬에 남겨 클립 서버가 계속 제공합니다.
+    """
+    video_file = os.path.basename(video_path)
+    remove_from_upload_tracker(video_path)
+    with upload_state_lock:
+        entry = load_upload_state().get(video_file, {})
+    # 재시작 후 다시 확인된 영상은 처음 업로드 시각 기준으로 보관 기간 유지
+    uploaded_at = entry.get("uploaded_at") or int(time.time())
+    update_upload_state(video_file, status="uploaded", uploaded_at=uploaded_at)
+    prune_uploaded_videos()
+
+
+def prune_uploaded_videos():
+    """보관 기간이나 용량을 넘긴 업로드 완료 영상을 오래된 것부터 삭제 (세그먼트 인덱스는 파일 존재로 정리)"""
+    now = time.time()
+    with upload_state_lock:
+        state = load_upload_state()
+        uploaded = []
+        for name, entry in state.items():
+            if entry.get("status") != "uploaded":
+                continue
+            path = os.path.join(RECORD_PATH, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            uploaded.append((entry.get("uploaded_at", 0), name, path, size))
+        uploaded.sort()
+
+        total = sum(size for _, _, _, size in uploaded)
+        removed = []
+        for uploaded_at, name, path, size in uploaded:
+            if now - uploaded_at < LOCAL_RETENTION_SEC and total <= LOCAL_RETENTION_BYTES:
+                break
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                    EVENTS.debug("video_removed", f"🗑️ 영상 삭제 완료: {name}")
+            except OSError as e:
+                EVENTS.warning("video_remove_failed", f"⚠️ 영상 삭제 실패: {name} - {e}")
+                continue
+            total -= size
+            state.pop(name, None)
+            removed.append(name)
+        if removed:
+            save_upload_state(state)
+    return removed
+
+
 @with_file_lock
 def upload_video_to_s3(video_path):
     if not os.path.exists(video_path):
-        logger.error(f"❌ 영상 파일 없음: {video_path}")
+        EVENTS.error("video_missing", f"❌ 영상 파일 없음: {video_path}")
         return False
 
     video_file = os.path.basename(video_path)
     
     # 파일이 완전히 쓰여졌는지 확인
     if is_file_being_written(video_path):
-        logger.warning(f"⚠️ 파일이 아직 쓰여지는 중: {video_file}, 건너뜀")
+        EVENTS.warning("video_still_writing", f"⚠️ 파일이 아직 쓰여지는 중: {video_file}, 건너뜀")
         return False
     
+    network_available.wait()
     try:
-        logger.info(f"📤 영상 업로드 시작: {video_file}")
+        EVENTS.debug("video_upload_start", f"📤 영상 업로드 시작: {video_file}")
         sn = load_sn()
         if not sn:
-            logger.error("❌ SN 로드 실패")
+            EVENTS.error("sn_missing", "❌ SN 로드 실패")
             return False
 
         # 파일 크기 확인 (0 바이트 파일 확인)
         file_size = os.path.getsize(video_path)
         if file_size == 0:
-            logger.error(f"❌ 영상 파일이 비어있음: {video_file}")
+            EVENTS.error("video_empty", f"❌ 영상 파일이 비어있음: {video_file}")
             os.remove(video_path)
             remove_from_upload_tracker(video_path)
+            update_upload_state(video_file)
             return False
 
-        presigned_url = get_presigned_video_url(sn, video_file)
+        checksums = get_video_checksums(video_path)
+
+        # 이전 실행에서 이미 올라간 객체인지 체크섬으로 확인 (재부팅 후 중복 업로드 방지)
+        # - uploaded: 업로드 완료 후 로컬 보관 중인 영상 (같은 크기/수정 시각일 때만 상태 유지)
+        # - uploading: PUT 도중 중단됨, 서버 객체의 MD5 가 같으면 완료된 것으로 처리
+        status = checksums.get("status")
+        if status == "uploaded" or (
+            status == "uploading" and get_remote_video_md5(sn, video_file) == checksums["md5"]
+        ):
+            EVENTS.info("video_already_uploaded", f"⏭️ 이미 업로드된 영상, 건너뜀: {video_file}")
+            finish_video_upload(video_path)
+            return True
+
+        presigned_url = get_presigned_video_url(sn, video_file, checksums)
         if not presigned_url:
-            logger.error(f"❌ 영상 URL 발급 실패: {video_file}")
+            EVENTS.error("video_url_failed", f"❌ 영상 URL 발급 실패: {video_file}")
             return False
 
+        update_upload_state(video_file, status="uploading")
         with open(video_path, "rb") as f:
             res = requests.put(
                 presigned_url, 
                 data=f, 
-                headers={"Content-Type": "video/mp4"},
+                headers={
+                    "Content-Type": "video/mp4",
+                    "Content-MD5": md5_base64(checksums["md5"]),
+                },
                 timeout=60  # 타임아웃 늘림 (60초)
             )
-            if res.status_code == 200:
-                logger.info(f"✅ 영상 업로드 성공: {video_file}")
-                
-                # 업로드 트래커에서 해당 항목 제거
-                remove_from_upload_tracker(video_path)
-                
-                # 파일 삭제
-                os.remove(video_path)
-                logger.info(f"🗑️ 영상 삭제 완료: {video_file}")
-                return True
-            else:
-                logger.error(f"❌ 영상 업로드 실패: {video_file}, 상태 코드: {res.status_code}")
-                return False
+        if res.status_code == 200:
+            # 200 응답이면 S3 가 Content-MD5 로 내용을 검증한 것
+            # ETag 는 SSE-KMS/멀티파트에서 MD5 가 아닐 수 있으므로 차이는 경고만
+            etag = res.headers.get("ETag", "").strip('"')
+            if etag and etag != checksums["md5"]:
+                EVENTS.warning("video_etag_mismatch", f"⚠️ ETag 가 MD5 와 다름 (Content-MD5 검증 통과): {video_file}", local=checksums["md5"], etag=etag)
+
+            EVENTS.info("video_uploaded", f"✅ 영상 업로드 성공: {video_file}")
+            finish_video_upload(video_path)
+            return True
+        else:
+            EVENTS.error("video_upload_failed", f"❌ 영상 업로드 실패: {video_file}, 상태 코드: {res.status_code}")
+            return False
     except Exception as e:
-        logger.error(f"❌ 영상 업로드 오류: {video_path} - {e}")
+        EVENTS.error("video_upload_error", f"❌ 영상 업로드 오류: {video_path} - {e}")
         return False
 
 
@@ -240,15 +570,17 @@ def handle_failed_uploads():
             continue
             
         if retry_count >= MAX_RETRY:
-            logger.warning(f"⚠️ 최대 재시도 횟수 초과: {file_path}, 건너뜀")
+            EVENTS.warning("retry_exhausted", f"⚠️ 최대 재시도 횟수 초과: {file_path}, 건너뜀")
             failed_uploads.pop(file_path, None)
             continue
             
-        logger.info(f"🔄 업로드 재시도 ({retry_count+1}/{MAX_RETRY}): {file_path}")
+        EVENTS.info("upload_retry", f"🔄 업로드 재시도 ({retry_count+1}/{MAX_RETRY}): {file_path}")
         
         # 파일 유형에 따라 적절한 업로드 함수 호출
         if file_path.endswith('.jpg'):
             success = upload_and_remove_image(file_path)
+        elif file_path.endswith('.json'):
+            success = upload_and_remove_image(file_path, "application/json")
         elif file_path.endswith('.mp4'):
             success = upload_video_to_s3(file_path)
         else:
@@ -288,17 +620,141 @@ def load_upload_tracker():
         
         return upload_tasks
     except Exception as e:
-        logger.error(f"업로드 트래커 로드 오류: {e}")
+        EVENTS.error("tracker_load_failed", f"업로드 트래커 로드 오류: {e}")
         return []
 
 
+def _track_failure(future, path):
+    """업로드 실패 시 failed_uploads 에 추가 (재시도 횟수 유지)"""
+    if not future.result() and os.path.exists(path):
+        failed_uploads[path] = failed_uploads.get(path, 0)
+
+
+def _submit_image_upload(file_path, content_type="image/jpeg"):
+    future = image_upload_executor.submit(upload_and_remove_image, file_path, content_type)
+    future.add_done_callback(lambda f, path=file_path: _track_failure(f, path))
+
+
+def write_metadata_batch(force=False):
+    """모인 프레임 메타데이터를 JSON 파일로 저장하고 업로드 작업을 제출합니다."""
+    global metadata_results
+    with metadata_lock:
+        if not metadata_results or (not force and len(metadata_results) < METADATA_BATCH_SIZE):
+            return
+        batch, metadata_results = metadata_results, []
+
+    # SN_TIMESTAMP_meta.json (첫 프레임 기준)
+    # 폴더 스캔이 쓰는 중인 파일을 가져가지 않도록 임시 파일에 쓰고 추적 등록 후 이름 변경
+    meta_path = os.path.join(FRAME_PATH, f"{batch[0]['frame']}_meta.json")
+    tmp_path = meta_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"SN": load_sn(), "frames": batch}, f, separators=(",", ":"))
+        processed_files.add(os.path.basename(meta_path))
+        os.replace(tmp_path, meta_path)
+    except Exception as e:
+        EVENTS.error("metadata_save_failed", f"❌ 메타데이터 저장 실패: {meta_path} - {e}")
+        processed_files.discard(os.path.basename(meta_path))
+        return
+    EVENTS.info("metadata_queued", f"🧾 프레임 메타데이터 {len(batch)}개 업로드 큐에 추가: {os.path.basename(meta_path)}")
+    _submit_image_upload(meta_path, "application/json")
+
+
+def analyze_frames(paths):
+    """
+    프레임 배치를 분석해 메타데이터를 모으고, 원본 업로드가 필요한 프레임 경로만 반환합니다.
+    나머지 프레임은 로컬에서 삭제합니다.
+    """
+    try:
+        results = FRAME_ANALYZER.analyze(paths)
+    except Exception as e:
+        EVENTS.error("analysis_failed", f"❌ 프레임 분석 오류, 전체 업로드: {e}")
+        return paths
+
+    analyzed = {path for path, _ in results}
+    upload_paths = [path for path in paths if path not in analyzed]  # 읽지 못한 프레임은 그대로 업로드
+    for path, result in results:
+        if result["upload_image"]:
+            upload_paths.append(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    with metadata_lock:
+        metadata_results.extend(result for _, result in results)
+    write_metadata_batch()
+    return upload_paths
+
+
+def analyze_frame_batch(paths):
+    """분석 스레드(단일)에서 프레임을 시간순으로 분석한 뒤 전처리/업로드를 제출합니다."""
+    # 파일 이름이 SN_YYYYMMDD_HHMMSS.jpg 이므로 이름순 = 시간순
+    paths = analyze_frames(sorted(paths))
+    if paths:
+        preprocess_executor.submit(process_frame_batch, paths)
+
+
+def process_frame_batch(paths):
+    """전처리 스레드 풀에서 프레임 배치를 전처리한 뒤 업로드 작업을 제출합니다."""
+    for path in paths:
+        if FRAME_PREPROCESSOR is not None:
+            try:
+                result = FRAME_PREPROCESSOR.process(path)
+                if result:
+                    before, after = result
+                    EVENTS.count("frame_preprocessed")
+                    EVENTS.count("frame_bytes_saved", before - after)
+                    EVENTS.debug("frame_preprocessed", f"✂️ 프레임 전처리: {os.path.basename(path)} {before}→{after} bytes ({before - after} 절감)", saved=before - after)
+                else:
+                    EVENTS.warning("preprocess_failed", f"⚠️ 프레임 전처리 실패, 원본 업로드: {os.path.basename(path)}")
+            except Exception as e:
+                EVENTS.error("preprocess_error", f"❌ 프레임 전처리 오류: {path} - {e}")
+        _submit_image_upload(path)
+
+
+def flush_pending_frames(force=False):
+    """배치가 찼거나 오래 기다린 프레임을 전처리 스레드 풀에 넘깁니다."""
+    global pending_frames, pending_frames_since
+    with pending_frames_lock:
+        if not pending_frames:
+            return
+        waited = time.monotonic() - pending_frames_since
+        if not force and len(pending_frames) < PREPROCESS_BATCH_SIZE and waited < PREPROCESS_MAX_WAIT_SEC:
+            return
+        batch, pending_frames = pending_frames, []
+    if FRAME_ANALYZER is not None:
+        analytics_executor.submit(analyze_frame_batch, batch)
+    else:
+        preprocess_executor.submit(process_frame_batch, batch)
+
+
+def submit_image(file_path):
+    """프레임 업로드 작업을 스레드 풀에 제출합니다. 분석/전처리가 켜져 있으면 배치로 모아 처리합니다."""
+    global pending_frames_since
+    processed_files.add(os.path.basename(file_path))
+    if FRAME_PREPROCESSOR is None and FRAME_ANALYZER is None:
+        _submit_image_upload(file_path)
+        return
+    with pending_frames_lock:
+        if not pending_frames:
+            pending_frames_since = time.monotonic()
+        pending_frames.append(file_path)
+    flush_pending_frames()
+
+
+def submit_video(file_path):
+    """영상 업로드 작업을 스레드 풀에 제출합니다."""
+    future = video_upload_executor.submit(upload_video_to_s3, file_path)
+    future.add_done_callback(lambda f, path=file_path: _track_failure(f, path))
+    processed_videos.add(os.path.basename(file_path))
+
+
 def scan_frame_directory():
     try:
-        files = [f for f in os.listdir(FRAME_PATH) if f.endswith('.jpg')]
+        files = [f for f in os.listdir(FRAME_PATH) if f.endswith('.jpg') or f.endswith('_meta.json')]
         new_files = [f for f in files if f not in processed_files]
 
         if new_files:
-            logger.info(f"🔍 새 프레임 {len(new_files)}개 발견")
+            EVENTS.debug("frames_found", f"🔍 새 프레임 {len(new_files)}개 발견")
 
         for filename in new_files:
             # 원본 숫자 형식 파일은 처리하지 않음 (서버에서 이름 변경 예정)
@@ -311,20 +767,15 @@ def scan_frame_directory():
                 parts = filename.split('_')
                 if len(parts) >= 2 and len(parts[0]) > 5:
                     file_path = os.path.join(FRAME_PATH, filename)
-                    logger.info(f"🖼️ 프레임 업로드 큐에 추가: {filename}")
-                    
-                    # 스레드 풀에 업로드 작업 제출
-                    future = image_upload_executor.submit(upload_and_remove_image, file_path)
-                    
-                    # 콜백 함수를 등록하여 실패 시 failed_uploads에 추가
-                    def callback(future, path=file_path):
-                        if not future.result() and os.path.exists(path):
-                            failed_uploads[path] = failed_uploads.get(path, 0)
-                    
-                    future.add_done_callback(callback)
-                    processed_files.add(filename)
+                    if filename.endswith('.json'):
+                        # 이전 실행에서 업로드하지 못한 메타데이터
+                        processed_files.add(filename)
+                        _submit_image_upload(file_path, "application/json")
+                        continue
+                    EVENTS.debug("frame_queued", f"🖼️ 프레임 업로드 큐에 추가: {filename}")
+                    submit_image(file_path)
     except Exception as e:
-        logger.error(f"❌ 프레임 폴더 스캔 오류: {e}")
+        EVENTS.error("frame_scan_failed", f"❌ 프레임 폴더 스캔 오류: {e}")
 
 
 def scan_video_directory():
@@ -336,7 +787,7 @@ def scan_video_directory():
         new_files = [f for f in files if f not in processed_videos]
 
         if new_files:
-            logger.info(f"🔍 새 영상 {len(new_files)}개 발견")
+            EVENTS.info("videos_found", f"🔍 새 영상 {len(new_files)}개 발견")
 
         # 현재 시간
         current_time = datetime.now()
@@ -348,18 +799,8 @@ def scan_video_directory():
         for file_path in upload_tasks:
             file_name = os.path.basename(file_path)
             if file_name not in processed_videos and os.path.exists(file_path):
-                logger.info(f"📦 업로드 트래커에서 찾은 영상 업로드: {file_name}")
-                
-                # 스레드 풀을 사용하여 영상 업로드
-                future = video_upload_executor.submit(upload_video_to_s3, file_path)
-                
-                # 콜백 함수를 등록하여 실패 시 failed_uploads에 추가
-                def callback(future, path=file_path):
-                    if not future.result() and os.path.exists(path):
-                        failed_uploads[path] = failed_uploads.get(path, 0)
-                
-                future.add_done_callback(callback)
-                processed_videos.add(file_name)
+                EVENTS.info("tracker_video_queued", f"📦 업로드 트래커에서 찾은 영상 업로드: {file_name}")
+                submit_video(file_path)
         
         # 파일명 순으로 정렬해서 시간 순서대로 처리
         new_files.sort()
@@ -376,20 +817,10 @@ def scan_video_directory():
             if is_file_being_written(file_path):
                 continue
                 
-            logger.info(f"📦 영상 업로드 큐에 추가: {filename}")
-            
-            # 스레드 풀을 사용하여 영상 업로드
-            future = video_upload_executor.submit(upload_video_to_s3, file_path)
-            
-            # 콜백 함수를 등록하여 실패 시 failed_uploads에 추가
-            def callback(future, path=file_path):
-                if not future.result() and os.path.exists(path):
-                    failed_uploads[path] = failed_uploads.get(path, 0)
-            
-            future.add_done_callback(callback)
-            processed_videos.add(filename)
+            EVENTS.info("video_queued", f"📦 영상 업로드 큐에 추가: {filename}")
+            submit_video(file_path)
     except Exception as e:
-        logger.error(f"❌ 비디오 폴더 스캔 오류: {e}")
+        EVENTS.error("video_scan_failed", f"❌ 비디오 폴더 스캔 오류: {e}")
 
 
 def cleanup_stale_entries():
@@ -403,12 +834,31 @@ def cleanup_stale_entries():
     # 이미 처리된 파일 목록에서 더 이상 존재하지 않는 항목 제거
     processed_files = {f for f in processed_files if f in existing_frames}
     processed_videos = {f for f in processed_videos if f in existing_videos}
+
+    # 시간이 지나 보관 기간을 넘긴 업로드 완료 영상 정리
+    prune_uploaded_videos()
     
     # 주기적으로 로그 출력
-    logger.debug(f"현재 추적 중: 프레임 {len(processed_files)}개, 비디오 {len(processed_videos)}개")
+    EVENTS.debug("tracking_stats", f"현재 추적 중: 프레임 {len(processed_files)}개, 비디오 {len(processed_videos)}개")
 
 
-if __name__ == "__main__":
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log-level", choices=list(LEVELS), default="INFO")
+    add_preprocess_args(parser)
+    add_analytics_args(parser)
+    add_retention_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_preprocess(args)
+    configure_analytics(args)
+    configure_retention(args)
+    EVENTS.configure(service="s3_upload", level=LEVELS[args.log_level])
+    EVENTS.install_dump_signal()
+
     logger.info("🚀 S3 업로드 서비스 시작...")
     logger.info(f"📂 영상 경로: {RECORD_PATH}")
     logger.info(f"📂 프레임 경로: {FRAME_PATH}")
@@ -417,6 +867,12 @@ if __name__ == "__main__":
     with open(LOCK_FILE, 'w+') as f:
         pass
 
+    monitor = NetworkMonitor()
+    monitor.add_listener(on_network_change)
+    if not monitor.start():
+        # 모니터를 쓸 수 없으면 항상 연결된 것으로 간주 (기존 동작)
+        network_available.set()
+
     try:
         logger.info("🧹 기존 파일 확인 중...")
         scan_frame_directory()
@@ -430,9 +886,11 @@ if __name__ == "__main__":
             # 폴더 스캔
             scan_frame_directory()
             scan_video_directory()
+            flush_pending_frames()
             
-            # 실패한 업로드 처리
-            handle_failed_uploads()
+            # 실패한 업로드 처리 (오프라인이면 다음으로 미룸)
+            if network_available.is_set():
+                handle_failed_uploads()
             
             # 300회 스캔마다 (약 2.5분마다) 오래된 항목 정리
             cleanup_counter += 1
@@ -446,7 +904,16 @@ if __name__ == "__main__":
         
         # 스레드 풀 정상 종료
         logger.info("🛑 업로드 작업 완료 대기 중...")
+        network_available.set()  # 연결 대기 중인 작업이 멈춰있지 않도록
+        flush_pending_frames(force=True)
+        analytics_executor.shutdown(wait=True)
+        preprocess_executor.shutdown(wait=True)
+        write_metadata_batch(force=True)
         image_upload_executor.shutdown(wait=True)
         video_upload_executor.shutdown(wait=True)
         
-        logger.info("✅ S3 업로드 서비스 종료")
\ No newline at end of file
+        logger.info("✅ S3 업로드 서비스 종료")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import json
+import struct
+import threading
+
+from event_log import EVENTS
+
+
+# MP4 박스 순회 (버퍼 내부)
+def _iter_boxes(data, start=0, end=None):
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type.decode("latin-1"), pos + header, pos + size
+        pos += size
+
+
+def _find_box(data, path, start=0, end=None):
+    """'moov/trak/mdia' 형식 경로의 첫 번째 박스 (본문 시작, 끝) 반환"""
+    name, _, rest = path.partition("/")
+    for box_type, body, box_end in _iter_boxes(data, start, end):
+        if box_type == name:
+            if not rest:
+                return body, box_end
+            return _find_box(data, rest, body, box_end)
+    return None
+
+
+def _read_moov(path):
+    """파일 최상위 박스를 건너뛰며 moov 박스만 읽어옴 (mdat은 읽지 않음)"""
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            size, box_type = struct.unpack(">I4s", header[:8])
+            header_len = 8
+            if size == 1:
+                size = struct.unpack(">Q", header[8:16])[0]
+                header_len = 16
+            elif size == 0:
+                size = file_size - pos
+            if size < header_len:
+                return None
+            if box_type == b"moov":
+                f.seek(pos)
+                return f.read(size)
+            pos += size
+    return None
+
+
+def _full_box_entries(data, body, fmt, count_offset=4):
+    """버전/플래그 + 엔트리 수 + 고정 크기 엔트리 테이블 파싱"""
+    count = struct.unpack(">I", data[body + count_offset:body + count_offset + 4])[0]
+    entry_size = struct.calcsize(fmt)
+    start = body + count_offset + 4
+    return [
+        struct.unpack(fmt, data[start + i * entry_size:start + (i + 1) * entry_size])
+        for i in range(count)
+    ]
+
+
+def _video_track(moov):
+    for box_type, body, box_end in _iter_boxes(moov, 8):
+        if box_type != "trak":
+            continue
+        hdlr = _find_box(moov, "mdia/hdlr", body, box_end)
+        if hdlr and moov[hdlr[0] + 8:hdlr[0] + 12] == b"vide":
+            return body, box_end
+    return None
+
+
+def read_keyframes(path):
+    """
+    MP4 파일의 moov 박스에서 비디오 트랙의 길이와 키프레임 위치를 읽습니다.
+    (duration 초, [(키프레임 시각 초, 바이트 오프셋), ...]) 반환, 실패 시 None
+    """
+    moov = _read_moov(path)
+    if not moov:
+        return None
+
+    trak = _video_track(moov)
+    if not trak:
+        return None
+    body, end = trak
+
+    mdhd = _find_box(moov, "mdia/mdhd", body, end)
+    stbl = _find_box(moov, "mdia/minf/stbl", body, end)
+    if not mdhd or not stbl:
+        return None
+
+    if moov[mdhd[0]] == 1:
+        timescale, duration = struct.unpack(">IQ", moov[mdhd[0] + 20:mdhd[0] + 32])
+    else:
+        timescale, duration = struct.unpack(">II", moov[mdhd[0] + 12:mdhd[0] + 20])
+    if not timescale:
+        return None
+
+    boxes = {}
+    for box_type, box_body, box_end in _iter_boxes(moov, stbl[0], stbl[1]):
+        boxes[box_type] = box_body
+
+    if "stts" not in boxes or "stsz" not in boxes or "stsc" not in boxes:
+        return None
+
+    # 샘플별 크기
+    stsz = boxes["stsz"]
+    uniform_size, sample_count = struct.unpack(">II", moov[stsz + 4:stsz + 12])
+    if uniform_size:
+        sizes = [uniform_size] * sample_count
+    else:
+        sizes = list(struct.unpack(f">{sample_count}I", moov[stsz + 12:stsz + 12 + 4 * sample_count]))
+
+    # 청크 오프셋
+    if "co64" in boxes:
+        chunk_offsets = [e[0] for e in _full_box_entries(moov, boxes["co64"], ">Q")]
+    elif "stco" in boxes:
+        chunk_offsets = [e[0] for e in _full_box_entries(moov, boxes["stco"], ">I")]
+    else:
+        return None
+
+    # 샘플별 바이트 오프셋 (stsc: 청크당 샘플 수)
+    stsc = _full_box_entries(moov, boxes["stsc"], ">III")
+    offsets = []
+    for i, (first_chunk, per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            offset = chunk_offsets[chunk - 1]
+            for _ in range(per_chunk):
+                if len(offsets) >= sample_count:
+                    break
+                offsets.append(offset)
+                offset += sizes[len(offsets) - 1]
+
+    # 샘플별 디코딩 시각
+    times = []
+    t = 0
+    for count, delta in _full_box_entries(moov, boxes["stts"], ">II"):
+        for _ in range(count):
+            times.append(t)
+            t += delta
+
+    # 키프레임 (stss 없으면 모든 샘플이 키프레임)
+    if "stss" in boxes:
+        sync = [e[0] - 1 for e in _full_box_entries(moov, boxes["stss"], ">I")]
+    else:
+        sync = range(sample_count)
+
+    keyframes = [
+        (round(times[i] / timescale, 3), offsets[i])
+        for i in sync
+        if i < len(offsets) and i < len(times)
+    ]
+    return duration / timescale, keyframes
+
+
+class SegmentIndex:
+    """
+    로컬에 남아있는 녹화 세그먼트 목록 (시작 시각, 길이, 크기, 키프레임 오프셋)
+    RTSP 서버의 메인 루프와 클립 서버 스레드가 함께 사용하므로 잠금으로 보호합니다.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._segments = []
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                self._segments = json.load(f)
+        except Exception:
+            self._segments = []
+        self.prune()
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._segments, f)
+        os.replace(tmp_path, self.index_path)
+
+    def add(self, path, start_time):
+        """세그먼트 파일을 분석해 인덱스에 추가합니다."""
+        info = read_keyframes(path)
+        if info is None:
+            EVENTS.warning("segment_index_failed", f"⚠️ 세그먼트 인덱싱 실패: {path}", path=path)
+            return None
+        duration, keyframes = info
+        entry = {
+            "file": os.path.basename(path),
+            "path": path,
+            "start": start_time,
+            "duration": round(duration, 3),
+            "size": os.path.getsize(path),
+            "keyframes": keyframes,
+        }
+        with self._lock:
+            self._segments = [s for s in self._segments if s["path"] != path]
+            self._segments.append(entry)
+            self._segments.sort(key=lambda s: s["start"])
+            self._prune_locked()
+            self._save()
+        return entry
+
+    def _prune_locked(self):
+        self._segments = [s for s in self._segments if os.path.exists(s["path"])]
+
+    def prune(self):
+        """업로드 후 삭제된 세그먼트 항목 제거"""
+        with self._lock:
+            before = len(self._segments)
+            self._prune_locked()
+            if len(self._segments) != before:
+                self._save()
+
+    def list(self, start=None, end=None):
+        """[start, end) 구간과 겹치는 세그먼트 목록 (epoch 초)"""
+        self.prune()
+        with self._lock:
+            return [
+                s for s in self._segments
+                if (end is None or s["start"] < end)
+                and (start is None or s["start"] + s["duration"] > start)
+            ]
+
+    def get(self, filename):
+        for segment in self.list():
+            if segment["file"] == filename:
+                return segment
+        return None